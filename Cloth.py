@@ -1,110 +1,728 @@
 import torch
 import torch.nn as nn
 import numpy as np
-import matplotlib.pyplot as plt
 import time
-import cv2
+
+from backends import make_backend
+from collision import SpatialHash
+from profiler import NULL_PHASE
+
+# dtype= choices for the simulation state. Energy sums accumulate in float32
+# (float64 for float64 cloths), whatever the storage precision
+DTYPES = {"float16": torch.float16, "bfloat16": torch.bfloat16, "float32": torch.float32, "float64": torch.float64}
+# Methods that may step a float16/bfloat16 cloth. A verlet, euler or pbd step moves a
+# particle by less than the position ulp, so the update rounds away in storage (computing
+# it in float32 does not help); implicit still moves, bfloat16 only coarsely
+HALF_METHODS = ("implicit",)
+# Rasterizer buffers, left out of Cloth.memory_footprint
+RENDER_BUFFERS = ("frame_t", "frame_dev", "frame_host", "color", "pix", "pix_idx")
+
+
+def check_dtype(method, dtype):
+    """Raise ValueError when `method` cannot step a cloth stored in `dtype` (name or torch dtype)"""
+    dtype = DTYPES.get(dtype, dtype)
+    if dtype in (torch.float16, torch.bfloat16) and method not in HALF_METHODS:
+        name = str(dtype).replace("torch.", "")
+        raise ValueError(f"method {method!r} cannot step a {name} cloth, use float32 or float64 "
+                         f"(or method {' / '.join(HALF_METHODS)})")
+
+
+def resolve_device(device):
+    """Map "auto" to cuda when it is available, else cpu; CUDA is only queried here"""
+    if device == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
 
 class Cloth(nn.Module):
-    def __init__(self, height, width, spacing, mass, gravity, stiffness=4.,alpha=0.003, decay=0.99997, init_energy=1e3, device="cuda", method="verlet"):
+    def __init__(self, height, width, spacing, mass, gravity, stiffness=4.,alpha=0.003, decay=0.99997, init_energy=1e3, device="cuda", method="verlet", force_kernel="stencil", preallocate=False, diag_size=0, log_every=0, batch=None, iterations=20, damping=0.01, cg_tol=1e-5, cg_iters=50, colliders=None, self_collision=False, collision_distance=None, backend="eager", dtype="float32"):
         super(Cloth, self).__init__() 
         self.width = width
         self.height = height
         self.spacing = spacing
+        if isinstance(dtype, str):
+            if dtype not in DTYPES:
+                raise ValueError(f"unknown dtype {dtype!r}, expected one of {', '.join(DTYPES)}")
+            dtype = DTYPES[dtype]
+        check_dtype(method, dtype)
+        self.dtype = dtype
+        self.accum_dtype = torch.float64 if dtype == torch.float64 else torch.float32
+        # Smallest safe divisor for normalizing displacements (1e-12 is 0 in float16)
+        self.eps = max(1e-12, torch.finfo(dtype).tiny)
         x = np.arange(0, width * spacing, spacing)
         y = np.arange(0, height * spacing, spacing)
-        self.pos = torch.tensor(np.array(np.meshgrid(y, x)).T.reshape(-1, 2), dtype=torch.float32).view(height, width, 2)
-        self.prev_pos = self.pos.clone()
-        self.velo = torch.zeros_like(self.pos)
-        self.mass = mass
-        self.gravity = gravity
-        self.stiffness = stiffness
+        self.pos = torch.tensor(np.array(np.meshgrid(y, x)).T.reshape(-1, 2), dtype=dtype).view(height, width, 2)
+        # With batch=B the state is [B, H, W, 2] and every parameter may be a scalar
+        # or a length-B sequence, so B cloths advance in one vectorized step
+        self.batch = batch
+        self.batch_shape = () if batch is None else (batch,)
+        self.device = resolve_device(device)
+        self.mass = self._per_instance(mass, field=True)
+        self.gravity = self._per_instance(gravity, field=True)
+        self.stiffness = self._per_instance(stiffness, field=True)
         # self.dir = [(0, 1),(1, 0), (1, 1), (-1, 1), (0, -1), (-1, 0), (-1, -1), (1, -1)]
         self.dir = [(0, 1),(1, 0), (0, -1), (-1, 0)]
         self.last_t = None
         self.method = method  
         self.couu = 0
-        self.device = device
         # Move tensors to GPU once during initialization
-        self.pos = self.pos.to(self.device)
-        self.prev_pos = self.prev_pos.to(self.device)
-        self.velo = self.velo.to(self.device)
-        self.energy_l = torch.tensor(init_energy, device=self.device, dtype=torch.float32)
+        self.pos = self.pos.to(self.device).expand(*self.batch_shape, height, width, 2).contiguous()
+        # Only the state the method integrates: velocities for euler/implicit, the
+        # previous positions for verlet/pbd (set_method converts between the two)
+        self.prev_pos = None if method in ("euler", "implicit") else self.pos.clone()
+        self.velo = torch.zeros_like(self.pos) if method in ("euler", "implicit") else None
+        self.energy_l = torch.empty(self.batch_shape, device=self.device, dtype=self.accum_dtype)
+        self.energy_l[...] = torch.as_tensor(init_energy, dtype=self.accum_dtype)
+        self.init_energy = init_energy
+        self.energy = torch.zeros(self.batch_shape, device=self.device, dtype=self.accum_dtype)
+
+        self.alpha = self._per_instance(alpha)
+        self.decay = self._per_instance(decay)
+        # Index of the batched cloth drawn by render()
+        self.render_index = 0
+
+        # "stencil" computes all neighbour springs in one padded-Laplacian pass,
+        # "slice" is the original per-direction slice-and-add
+        self.force_kernel = force_kernel
+
+        # method="pbd": XPBD distance constraints along the grid solved with `iterations`
+        # Jacobi sweeps per step, compliance 1/stiffness; damping removes that fraction of
+        # the velocity every step, the only energy loss pbd has (there is no limiter)
+        self.iterations = iterations
+        self.damping = damping
+
+        # method="implicit": backward Euler, solved by matrix-free conjugate gradient
+        # until the residual drops by cg_tol or after cg_iters iterations
+        self.cg_tol = cg_tol
+        self.cg_iters = cg_iters
+        self.cg_used = 0
+
+        # Obstacles (collision.Sphere/Box/Floor) and self-collision are resolved on the
+        # positions after every step; particles closer than collision_distance that
+        # are not spring neighbours get pushed apart
+        self.colliders = list(colliders or [])
+        self.self_collision = SpatialHash(collision_distance or 0.5 * spacing) if self_collision else None
+
+        self.preallocate = preallocate
+        self._build_grid()
+
+        # Step backend (backends.py): "eager" torch ops, a torch.compile'd step or the
+        # NumPy/Numba CPU kernel; each imports and compiles what it needs on first use
+        self.backend = backend
+        self.stepper = make_backend(backend)
+
+        # On-device ring buffer of (energy, energy_l) per step, read back only on demand
+        # or every log_every steps by forward(), so stepping never waits on the device
+        self.steps = 0
+        self.diagnostics = torch.zeros(diag_size, 2, *self.batch_shape, device=self.device, dtype=self.accum_dtype) if diag_size else None
+        self.log_every = log_every
+        self.last_log = 0
+        # Set by trajectory.TrajectoryRecorder, which captures positions after each step
+        self.recorder = None
+        # Optional profiler.Profiler timing the step and render phases
+        self.profiler = None
+        # Timestep of the last step, used to convert between velocity and prev_pos
+        self.last_dt = None
+
+    def _build_grid(self):
+        """(Re)create everything derived from the grid size, device and method"""
+        height, width = self.height, self.width
+        self.padded = torch.zeros(*self.batch_shape, height + 2, width + 2, 2, device=self.device, dtype=self.dtype)
+        self.neighbors = torch.zeros(height, width, 1, device=self.device, dtype=self.dtype)
+        for ii, jj in self.dir:
+            self.neighbors[max(0, -ii):height - max(0, ii), max(0, -jj):width - max(0, jj)] += 1
+
+        # Pins: a mask shared by the batch and the positions the pinned particles are held
+        # at. inv_mass is 0 at the pins and masks the pbd weights, the implicit solve and
+        # the collisions; free_mask is the same mask at full [H, W, 2] width (a broadcast
+        # trailing axis makes elementwise ops several times slower) and pin_pos the
+        # targets with zeros elsewhere, so pinning is one fused multiply-add per step
+        self.pinned = torch.zeros(height, width, 1, device=self.device, dtype=torch.bool)
+        self.inv_mass = torch.ones(height, width, 1, device=self.device, dtype=self.dtype)
+        self.free_mask = torch.ones(height, width, 2, device=self.device, dtype=self.dtype)
+        self.pin_target = self.pos.clone()
+        self.pin_pos = torch.zeros_like(self.pos)
+        # Default anchors: every 9th particle on the first row and on the left half of the last row
+        self.pin((-1, slice(0, width // 2, 9)))
+        self.pin((0, slice(0, width, 9)))
+
+        self._step_buffers()
+        # Render buffers are created on the first render() call
+        self.frame_t = None
+        self.frame_dev = None
+        self.pix = None
+
+    def _step_buffers(self):
+        """Persistent scratch buffers so a step allocates nothing; pos/prev_pos ping-pong
+
+        Only _step_inplace (verlet and euler) uses them, pbd and implicit get None.
+        """
+        alloc = self.preallocate and self.method in ("verlet", "euler")
+        self.force = torch.empty_like(self.pos) if alloc else None
+        self.delta = torch.empty_like(self.pos) if alloc else None
+        self.newpos = torch.empty_like(self.pos) if alloc and self.method == "euler" else None
+        self.vel = torch.empty(*self.pos.shape[:-1], 1, device=self.device, dtype=self.dtype) if alloc else None
+        self.vel_norm = torch.empty_like(self.vel) if alloc else None
+        self.energy_n = torch.empty_like(self.energy) if alloc else None
+        self.scale = torch.empty_like(self.energy) if alloc else None
+
+    def set_params(self, **params):
+        """Change parameters of the running cloth in place, keeping its state
+
+        Physical parameters (mass, gravity, stiffness, alpha, decay, ...) take
+        effect on the next step; method, device and height/width go through
+        set_method, to_device and resize.
+        """
+        if "height" in params or "width" in params:
+            self.resize(int(params.pop("height", self.height)), int(params.pop("width", self.width)))
+        if "device" in params:
+            self.to_device(params.pop("device"))
+        if "method" in params:
+            self.set_method(params.pop("method"))
+        if "backend" in params:
+            self.set_backend(params.pop("backend"))
+        for name, value in params.items():
+            if name in ("mass", "gravity", "stiffness"):
+                value = self._per_instance(value, field=True)
+            elif name in ("alpha", "decay"):
+                value = self._per_instance(value)
+            elif name not in ("spacing", "iterations", "damping", "cg_tol", "cg_iters", "render_index"):
+                raise ValueError(f"{name} cannot be changed on a running cloth")
+            setattr(self, name, value)
+
+    def set_method(self, method):
+        """Switch integrator, carrying the motion over between velocity and prev_pos"""
+        if method == self.method:
+            return
+        check_dtype(method, self.dtype)
+        dt = self.last_dt or 1.0
+        with torch.no_grad():
+            if method in ("euler", "implicit") and self.method in ("verlet", "pbd"):
+                self.velo = (self.pos - self.prev_pos).div_(dt)
+                self.prev_pos = None
+            elif method in ("verlet", "pbd") and self.method in ("euler", "implicit"):
+                self.prev_pos = self.pos - self.velo * dt
+                self.velo = None
+        self.method = method
+        self._step_buffers()
+
+    def set_backend(self, backend):
+        """Step with another backend from now on"""
+        if backend != self.backend:
+            self.stepper = make_backend(backend)
+            self.backend = backend
 
-        self.alpha = alpha
-        self.decay = decay
+    def to_device(self, device):
+        """Move the whole simulation, state and buffers, to another device"""
+        device = resolve_device(device)
+        self.device = device
+        for name, value in list(vars(self).items()):
+            # frame_host stays a (pinned) host buffer
+            if torch.is_tensor(value) and name != "frame_host":
+                setattr(self, name, value.to(device))
+        self.frame_t = None
+        self.frame_dev = None
+
+    def resize(self, height, width):
+        """Resample the current state onto a height x width grid
+
+        Positions, prev_pos and velocities are bilinearly interpolated; positions
+        are rescaled so neighbouring particles stay about `spacing` apart and the
+        cloth keeps its shape on screen. Refused while a trajectory recorder is
+        attached, since its file has a fixed frame shape.
+        """
+        if (height, width) == (self.height, self.width):
+            return
+        if self.recorder is not None:
+            raise RuntimeError("cannot resize a cloth that is being recorded; close the TrajectoryRecorder first")
+        scale = torch.tensor([(height - 1) / max(self.height - 1, 1), (width - 1) / max(self.width - 1, 1)], device=self.pos.device, dtype=self.dtype)
+
+        def resample(field):
+            if field is None:
+                return None
+            planar = field.reshape(-1, self.height, self.width, 2).permute(0, 3, 1, 2)
+            out = torch.nn.functional.interpolate(planar, size=(height, width), mode="bilinear", align_corners=True)
+            return out.permute(0, 2, 3, 1).reshape(*self.batch_shape, height, width, 2).contiguous() * scale
+
+        with torch.no_grad():
+            self.pos = resample(self.pos)
+            self.prev_pos = resample(self.prev_pos)
+            self.velo = resample(self.velo)
+        self.height, self.width = height, width
+        self._build_grid()
+
+    def _grid_key(self, index):
+        """Index of the [H, W, 1] grid tensors for a bool mask or a (rows, cols) pair"""
+        if isinstance(index, tuple):
+            return (*index, slice(None))
+        return (index, slice(None))
+
+    def pin(self, index, target=None):
+        """Hold the particles at `index` where they are, or at `target`
+
+        index selects particles of the [H, W] grid: a bool mask, or a (rows, cols)
+        pair of ints, slices or index tensors. target broadcasts against
+        pos[..., rows, cols, :]. Pinned particles take no force, carry no velocity
+        and follow their target from the next step on (see move_pins).
+        """
+        key = self._grid_key(index)
+        with torch.no_grad():
+            self.pinned[key] = True
+            self.pin_target[(..., *key)] = self.pos[(..., *key)] if target is None else target
+            if self.velo is not None:
+                self.velo[(..., *key)] = 0
+            self._update_pins()
+            self._apply_pins()
+
+    def unpin(self, index):
+        """Release the particles at `index` (as in pin), at rest where they are"""
+        with torch.no_grad():
+            self.pinned[self._grid_key(index)] = False
+            self._update_pins()
+
+    def clear_pins(self):
+        """Release every particle, including the default anchors"""
+        with torch.no_grad():
+            self.pinned.zero_()
+            self._update_pins()
+
+    def move_pins(self, index, target):
+        """Set new targets for pinned particles; they get there on the next step"""
+        with torch.no_grad():
+            self.pin_target[(..., *self._grid_key(index))] = target
+            self._update_pins()
+
+    def _update_pins(self):
+        """Rebuild the masks and pin_pos from pinned and pin_target"""
+        torch.logical_not(self.pinned, out=self.inv_mass)
+        self.free_mask.copy_(self.inv_mass.expand_as(self.free_mask))
+        torch.mul(self.pin_target, 1 - self.free_mask, out=self.pin_pos)
+
+    def _apply_pins(self):
+        """Put the pinned particles at their targets, at the same cost for any number of pins"""
+        torch.addcmul(self.pin_pos, self.pos, self.free_mask, out=self.pos)
+        # The position methods get their velocity from prev_pos, so pinning it too keeps
+        # a moving pin from feeding its motion into the energy limiter
+        if self.method in ("verlet", "pbd"):
+            torch.addcmul(self.pin_pos, self.prev_pos, self.free_mask, out=self.prev_pos)
 
-    def forward(self):
+    def view_transform(self, w, h):
+        """(scale, offset) of the render_into view of a w x h buffer: pixel (y, x) = pos * scale + offset"""
+        scale = torch.tensor([-104 / self.height * h / 800, 784 / self.width * w / 800])
+        offset = torch.tensor([112 * h / 800, 8 * w / 800])
+        return scale, offset
+
+    def _phase(self, name):
+        """Profiler phase context, a no-op unless self.profiler is set"""
+        if self.profiler is None:
+            return NULL_PHASE
+        return self.profiler.phase(name, cuda=self.pos.device.type == "cuda")
+
+    def _per_instance(self, value, field=False):
+        """Scalars stay Python numbers; a sequence becomes one value per batched cloth"""
+        if self.batch is None or np.isscalar(value):
+            return value
+        # field parameters broadcast against [B, H, W, 2], the others against the [B] energies
+        value = torch.as_tensor(value, dtype=self.dtype if field else self.accum_dtype, device=self.device)
+        return value.view(-1, 1, 1, 1) if field else value.view(-1)
+
+    def config(self):
+        """Constructor arguments describing this cloth, as JSON-friendly values"""
+        def value(v):
+            return v.flatten().tolist() if torch.is_tensor(v) else v
+        return {
+            "height": self.height, "width": self.width, "spacing": self.spacing,
+            "mass": value(self.mass), "gravity": value(self.gravity), "stiffness": value(self.stiffness),
+            "alpha": value(self.alpha), "decay": value(self.decay), "method": self.method,
+            "force_kernel": self.force_kernel, "batch": self.batch, "iterations": self.iterations,
+            "damping": self.damping, "cg_tol": self.cg_tol, "cg_iters": self.cg_iters,
+            "dtype": str(self.dtype).replace("torch.", ""), "init_energy": value(self.init_energy),
+            "self_collision": self.self_collision is not None,
+            "collision_distance": self.self_collision.distance if self.self_collision is not None else None,
+        }
+
+    def save_state(self, path=None):
+        """Snapshot of the simulation state and parameters on the CPU, optionally saved to path"""
+        def cpu(value):
+            return None if value is None else value.cpu()
+
+        state = {
+            "config": self.config(),
+            "steps": self.steps,
+            "pos": self.pos.cpu(),
+            "prev_pos": cpu(self.prev_pos),
+            "velo": cpu(self.velo),
+            "energy": self.energy.cpu(),
+            "energy_l": self.energy_l.cpu(),
+            "pinned": self.pinned.cpu(),
+            "pin_target": self.pin_target.cpu(),
+        }
+        if path is not None:
+            torch.save(state, path)
+        return state
+
+    def load_state(self, state):
+        """Restore a save_state() snapshot (or a path to one) into this cloth, on its device
+
+        The grid and batch must match; the parameters of this cloth are kept.
+        """
+        if isinstance(state, str):
+            state = torch.load(state, map_location="cpu")
+        if tuple(state["pos"].shape) != tuple(self.pos.shape):
+            raise ValueError(f"state of shape {tuple(state['pos'].shape)} does not fit a cloth of shape {tuple(self.pos.shape)}")
+        with torch.no_grad():
+            # copy_ keeps the preallocated buffers (and their ping-pong) in place
+            for name in ("pos", "prev_pos", "velo", "energy", "energy_l"):
+                if getattr(self, name) is not None and state.get(name) is not None:
+                    getattr(self, name).copy_(state[name])
+            # A snapshot of a method keeping the other kind of state starts at rest
+            if self.prev_pos is not None and state.get("prev_pos") is None:
+                self.prev_pos.copy_(self.pos)
+            if self.velo is not None and state.get("velo") is None:
+                self.velo.zero_()
+            # Snapshots from before the pin API keep this cloth's pins
+            if "pinned" in state:
+                self.pinned.copy_(state["pinned"])
+                self.pin_target.copy_(state["pin_target"])
+                self._update_pins()
+        self.steps = state["steps"]
+        self.last_t = None
+        return self
+
+    @classmethod
+    def from_state(cls, state, device="cuda", **kwargs):
+        """Build a cloth from a save_state() snapshot; kwargs override the saved config"""
+        if isinstance(state, str):
+            state = torch.load(state, map_location="cpu")
+        config = dict(state["config"], device=device, **kwargs)
+        return cls(**config).load_state(state)
+
+    def forward(self, substeps=1):
         with torch.no_grad(): 
             """Update cloth physics and return frame"""
-            if self.last_t is None:
-                del_t = 1 / 150
-                self.last_t = time.time()
+            self.tick(substeps)
+            return self.render()
+
+    def tick(self, substeps=1):
+        """Advance the physics by the (scaled) wall-clock time since the last call"""
+        if self.last_t is None:
+            del_t = 1 / 150
+            self.last_t = time.time()
+        else:
+            tt = time.time()
+            del_t = tt - self.last_t
+            self.last_t = tt
+        del_t *= 13
+        self.step(del_t / substeps, substeps)
+
+        if self.log_every and self.steps - self.last_log >= self.log_every:
+            self.last_log = self.steps
+            energy, energy_l = self.read_diagnostics()[-1]
+            print("Energy: ", energy, energy_l, self.pos.device)
+        return self.pos
+
+    def step(self, dt, substeps=1):
+        """Advance the physics by `substeps` fixed steps of size dt, without rendering"""
+        self.last_dt = dt
+        with torch.no_grad():
+            for _ in range(substeps):
+                self.stepper.step(self, dt)
+                with self._phase("pins"):
+                    self._apply_pins()
+                if self.colliders or self.self_collision is not None:
+                    with self._phase("collide"):
+                        self._collide(dt)
+                if self.diagnostics is not None:
+                    slot = self.diagnostics[self.steps % len(self.diagnostics)]
+                    slot[0].copy_(self.energy)
+                    slot[1].copy_(self.energy_l)
+                self.steps += 1
+                if self.recorder is not None:
+                    self.recorder.capture()
+        return self.pos
+
+    def _integrate(self, dt):
+        """One step of the current method with the torch kernels (what the backends run)"""
+        if self.method == "pbd":
+            self._step_pbd(dt)
+        elif self.method == "implicit":
+            self._step_implicit(dt)
+        elif self.preallocate:
+            self._step_inplace(dt)
+        else:
+            self._step(dt)
+
+    def _collide(self, del_t):
+        """Project the new positions out of the colliders and apart from each other"""
+        pos = self.pos
+        if self.self_collision is not None:
+            pos = pos + self.self_collision.solve(pos, self.inv_mass)
+        for collider in self.colliders:
+            pos = collider.project(pos)
+        # Pins stay put; the velocity-based methods lose the removed motion
+        pos = torch.where(self.pinned, self.pos, pos)
+        if self.method in ("euler", "implicit"):
+            self.velo.add_(pos - self.pos, alpha=1 / del_t)
+        self.pos.copy_(pos)
+
+    def read_diagnostics(self):
+        """Recorded (energy, energy_l) rows, oldest first, as a numpy array
+
+        Without a ring buffer only the latest step is returned. Batched cloths
+        give rows of shape (2, B).
+        """
+        if self.diagnostics is None:
+            return torch.stack([self.energy, self.energy_l])[None].cpu().numpy()
+        size = len(self.diagnostics)
+        rows = self.diagnostics.cpu().numpy()
+        if self.steps < size:
+            return rows[:self.steps]
+        return np.roll(rows, -(self.steps % size), axis=0)
+
+    def memory_footprint(self):
+        """Bytes held by each simulation tensor: the state, grid masks and step buffers
+
+        Render buffers are left out and tensors sharing storage counted once.
+        Without preallocate a step also allocates a few state-sized temporaries.
+        """
+        sizes, seen = {}, set()
+        for name, value in vars(self).items():
+            if torch.is_tensor(value) and name not in RENDER_BUFFERS:
+                storage = value.untyped_storage()
+                if storage.data_ptr() not in seen:
+                    seen.add(storage.data_ptr())
+                    sizes[name] = storage.nbytes()
+        return sizes
+
+    def bytes_per_particle(self):
+        """memory_footprint() per particle, for sizing the largest grid that fits a device"""
+        return sum(self.memory_footprint().values()) / (self.height * self.width * (self.batch or 1))
+
+    def _spring_force(self, out=None):
+        """Linear spring force on every particle from its neighbours in self.dir"""
+        if self.force_kernel == "slice":
+            if out is None:
+                force = torch.zeros_like(self.pos, device=self.pos.device)
             else:
-                tt = time.time()
-                del_t = tt - self.last_t
-                self.last_t = tt
-            del_t *= 13
-            force = torch.zeros_like(self.pos, device=self.pos.device)
-            force[:, :, 0] = -self.gravity * self.mass
+                force = out.zero_()
             for ii, jj in self.dir:
-                diff = self.pos[max(0, -ii):self.height - max(0, ii), max(0, -jj):self.width - max(0, jj)] - self.pos[max(0, ii):self.height - max(0, -ii), max(0, jj):self.width - max(0, -jj)]
+                diff = self.pos[..., max(0, -ii):self.height - max(0, ii), max(0, -jj):self.width - max(0, jj), :] - self.pos[..., max(0, ii):self.height - max(0, -ii), max(0, jj):self.width - max(0, -jj), :]
                 # f = -diff * torch.norm(diff, dim=2, keepdim=True)
                 f = -diff*self.stiffness
-                force[max(0, -ii):self.height - max(0, ii), max(0, -jj):self.width - max(0, jj)] += f
-            
-            idxx1 = torch.arange(0, self.pos.shape[1]//2, 9, device=self.pos.device)
-            idxx2 = torch.arange(0, self.pos.shape[1], 9, device=self.pos.device)
-            force[-1, idxx1] = 0
-            force[0, idxx2] = 0
+                force[..., max(0, -ii):self.height - max(0, ii), max(0, -jj):self.width - max(0, jj), :] += f
+            return force
+
+        force = self._laplacian(self.pos, out=out)
+        force *= self.stiffness
+        return force
+
+    def _laplacian(self, x, out=None):
+        """Sum over self.dir of (neighbour - x) for a [..., H, W, 2] field x"""
+        # Padded Laplacian: every neighbour is a shifted view of the zero-padded grid,
+        # missing neighbours read 0 and are cancelled by the per-particle neighbour count
+        self.padded[..., 1:-1, 1:-1, :] = x
+        views = [self.padded[..., 1 + ii:1 + ii + self.height, 1 + jj:1 + jj + self.width, :] for ii, jj in self.dir]
+        lap = torch.add(views[0], views[1], out=out)
+        for v in views[2:]:
+            lap += v
+        lap.addcmul_(self.neighbors, x, value=-1)
+        return lap
+
+    def _step(self, del_t):
+        """Single physics update with time step del_t"""
+        with self._phase("force"):
+            force = self._spring_force()
+            force[..., :1] -= self.gravity * self.mass
+            force *= self.free_mask
 
+        with self._phase("integrate"):
             if self.method == "verlet":
                 newpos = 2 * self.pos - self.prev_pos + force / self.mass * (del_t ** 2)
             elif self.method == "euler":
                 newpos = self.pos + self.velo * del_t
                 self.velo = self.velo + force / self.mass * del_t
 
-            vel = torch.norm(newpos - self.pos, dim=2, keepdim=True)
+        with self._phase("limit"):
+            vel = torch.norm(newpos - self.pos, dim=-1, keepdim=True)
 
             # vel = torch.clamp(vel, 0, self.spacing * 0.5)
             # vel = 2/(2+torch.exp(-5*vel)) - 2/3
 
-            energy = (vel**2).sum()
-            energy_n = min(energy, self.energy_l) * self.decay
+            energy = (vel**2).sum(dim=(-3, -2, -1), dtype=self.accum_dtype)
+            energy_n = torch.minimum(energy, self.energy_l) * self.decay
 
             pp = 0.8 if self.method == "verlet" else 1
             energy_n = energy_n * pp + energy * (1 - pp)
 
-            vel *= energy_n / (energy + 1e-6)
+            vel *= (energy_n / (energy + 1e-6))[..., None, None, None]
             self.energy_l = self.energy_l * (1-self.alpha) + (energy_n) * self.alpha
 
-            print("Energy: ", energy.item(), self.energy_l.item(), self.pos.device)
+            self.energy = energy
 
-            vel_dir = torch.nn.functional.normalize(newpos - self.pos, dim=2)
+            vel_dir = torch.nn.functional.normalize(newpos - self.pos, dim=-1, eps=self.eps)
             newpos = self.pos + vel_dir * vel
             if self.method == "verlet":
                 self.prev_pos = self.pos.clone()
             self.pos = newpos
-            # print(self.pos.device)
+        # print(self.pos.device)
+
+    def _step_pbd(self, del_t):
+        """Position-based step: predict under gravity, then project the distance constraints"""
+        with self._phase("integrate"):
+            # Planar [2, ..., H, W] layout keeps the constraint sweeps on contiguous rows
+            w = (self.inv_mass / self.mass)[..., 0]
+            pred = (self.pos + (self.pos - self.prev_pos) * (1 - self.damping)).movedim(-1, 0).contiguous()
+            # Batched [B, 1, 1, 1] parameters lose their trailing coordinate axis here
+            gravity = self.gravity[..., 0] if torch.is_tensor(self.gravity) else self.gravity
+            stiffness = self.stiffness[..., 0] if torch.is_tensor(self.stiffness) else self.stiffness
+            pred[0] -= gravity * del_t ** 2 * (w > 0)
+            compliance = 1 / (stiffness * del_t ** 2)
+
+        with self._phase("solve"):
+            # Horizontal constraints run along dim -1, vertical ones along dim -2;
+            # per constraint: end point weights, 1 / (w_a + w_b + compliance) and lambda
+            constraints = []
+            for dim in (-1, -2):
+                n = pred.shape[dim] - 1
+                w_a, w_b = w.narrow(dim, 0, n), w.narrow(dim, 1, n)
+                inv_denom = 1 / (w_a + w_b + compliance).clamp_min(1e-12)
+                lam = torch.zeros(pred.narrow(dim, 0, n).shape[1:], device=pred.device, dtype=pred.dtype)
+                constraints.append((dim, n, w_a, w_b, inv_denom, lam))
+            # Jacobi under-relaxation: a particle sums the corrections of up to four
+            # constraints, and 1/2 keeps that convergent even for stiff constraints. The
+            # same scaled dlam goes into lambda and into the positions, so the sweeps
+            # converge to the XPBD solution at the given stiffness
+            relax = 0.5
+
+            for _ in range(self.iterations):
+                corr = torch.zeros_like(pred)
+                for dim, n, w_a, w_b, inv_denom, lam in constraints:
+                    d = pred.narrow(dim, 1, n) - pred.narrow(dim, 0, n)
+                    length = torch.hypot(d[0], d[1])
+                    dlam = (self.spacing - length - compliance * lam) * inv_denom
+                    dlam *= relax
+                    lam += dlam
+                    d *= dlam / length.clamp_min(self.eps)
+                    corr.narrow(dim, 0, n).addcmul_(w_a, d, value=-1)
+                    corr.narrow(dim, 1, n).addcmul_(w_b, d)
+                pred += corr
+
+            pred = pred.movedim(0, -1).contiguous()
+            self.energy = ((pred - self.pos) ** 2).sum(dim=(-3, -2, -1), dtype=self.accum_dtype)
+            self.prev_pos = self.pos
+            self.pos = pred
+
+    def _step_implicit(self, del_t):
+        """Backward Euler step: solve (M - dt^2 K) v' = M v + dt f(x) for the new velocity"""
+        # The springs are linear, so K = stiffness * Laplacian and the system is exact;
+        # it is applied matrix-free with the same stencil as the force
+        with self._phase("force"):
+            force = self._spring_force()
+            force[..., :1] -= self.gravity * self.mass
+            # Pins are held by filtering their rows out of every residual and search direction
+            free = self.inv_mass
+            b = (self.velo * self.mass + force * del_t) * free
+            h2k = del_t ** 2 * self.stiffness
+
+            def apply(v):
+                return (v * self.mass - self._laplacian(v) * h2k) * free
+
+            def dot(a, c):
+                return (a * c).sum(dim=(-3, -2, -1), keepdim=True, dtype=self.accum_dtype)
+
+        with self._phase("solve"):
+            # Warm start from the previous velocity
+            v = self.velo * free
+            r = b - apply(v)
+            p = r.clone()
+            rr = dot(r, r)
+            limit = dot(b, b) * self.cg_tol ** 2
+            self.cg_used = 0
+            for i in range(self.cg_iters):
+                if bool((rr <= limit).all()):
+                    break
+                q = apply(p)
+                a = rr / dot(p, q).clamp_min(1e-30)
+                v.addcmul_(a, p)
+                r.addcmul_(a, q, value=-1)
+                rr_new = dot(r, r)
+                p.mul_(rr_new / rr.clamp_min(1e-30)).add_(r)
+                rr = rr_new
+                self.cg_used = i + 1
+
+        with self._phase("integrate"):
+            delta = v * del_t
+            self.energy = (delta ** 2).sum(dim=(-3, -2, -1), dtype=self.accum_dtype)
+            self.velo = v
+            self.pos = self.pos + delta
+
+    def _step_inplace(self, del_t):
+        """Same update as _step, written into the preallocated buffers"""
+        with self._phase("force"):
+            force = self._spring_force(out=self.force)
+            force[..., :1] -= self.gravity * self.mass
+            force *= self.free_mask
+
+        with self._phase("integrate"):
+            # delta = newpos - pos
+            delta = self.delta
+            if self.method == "verlet":
+                torch.sub(self.pos, self.prev_pos, out=delta)
+                delta.add_(force.mul_(del_t ** 2 / self.mass))
+                newpos = self.prev_pos  # old prev_pos is no longer needed
+            elif self.method == "euler":
+                torch.mul(self.velo, del_t, out=delta)
+                self.velo.add_(force.mul_(del_t / self.mass))
+                newpos = self.newpos
+
+        with self._phase("limit"):
+            vel = torch.linalg.vector_norm(delta, dim=-1, keepdim=True, out=self.vel)
+            energy = torch.sum(torch.square(vel, out=self.vel_norm), dim=(-3, -2, -1), dtype=self.accum_dtype,
+                               out=self.energy)
+            energy_n = torch.minimum(energy, self.energy_l, out=self.energy_n).mul_(self.decay)
+
+            pp = 0.8 if self.method == "verlet" else 1
+            energy_n.mul_(pp).add_(energy, alpha=1 - pp)
 
+            torch.add(energy, 1e-6, out=self.scale)
+            torch.div(energy_n, self.scale, out=self.scale)
+            self.energy_l.lerp_(energy_n, self.alpha)
+
+            # Normalized direction goes into the force buffer, which is free by now
+            vel_dir = torch.div(delta, torch.clamp_min(vel, self.eps, out=self.vel_norm), out=force)
+            vel.mul_(self.scale[..., None, None, None])
+            torch.addcmul(self.pos, vel_dir, vel, out=newpos)
+
+            if self.method == "verlet":
+                self.prev_pos, self.pos = self.pos, newpos
+            else:
+                self.newpos, self.pos = self.pos, newpos
+
+    def render(self):
+        """Rasterize the current positions into an 800x800 RGB frame"""
+        with torch.no_grad():
             # Convert positions directly to image array
             img_size = (804, 804, 3)  # Define your desired output size
+            if self.preallocate:
+                return self._render_inplace(img_size)
             frame = np.zeros(img_size, dtype=np.uint8)
-            frame_t = torch.zeros(img_size, dtype=torch.uint8).to("cuda")
+            with self._phase("rasterize"):
+                pos = self.pos if self.batch is None else self.pos[self.render_index]
+                frame_t = torch.zeros(img_size, dtype=torch.uint8, device=pos.device)
 
-            # Scale positions to image coordinates
+                # Scale positions to image coordinates
             
-            x = self.pos[:, :, 1].clone().to("cuda")
-            y = self.pos[:, :, 0].clone().to("cuda")
-            x = ((x / self.width) * (img_size[1] - 20) + 10)
-            y = ((y / self.height) * (img_size[0] - 700) + 690)
+                x = pos[:, :, 1].clone()
+                y = pos[:, :, 0].clone()
+                x = ((x / self.width) * (img_size[1] - 20) + 10)
+                y = ((y / self.height) * (img_size[0] - 700) + 690)
 
-            x = torch.clamp(x, 0, img_size[1] - 1).long()
-            y = torch.clamp(y, 0, img_size[0] - 1).long()
+                x = torch.clamp(x, 0, img_size[1] - 1).long()
+                y = torch.clamp(y, 0, img_size[0] - 1).long()
 
-            frame_t[y, x] = torch.tensor([0, 255, 0], dtype=torch.uint8, device="cuda")
+                frame_t[y, x] = torch.tensor([0, 255, 0], dtype=torch.uint8, device=pos.device)
 
-            frame_t = frame_t[2:802, 2:802] 
+                frame_t = frame_t[2:802, 2:802] 
 
             # x = x.cpu().numpy().astype(np.int32)
             # y = y.cpu().numpy().astype(np.int32)
@@ -124,4 +742,119 @@ class Cloth(nn.Module):
             #     for j in range(x.shape[1]):
             #         cv2.line(frame, (x[i, j], y[i, j]), (x[i + 1, j], y[i + 1, j]), (128, 128, 128), 1)
 
-            return frame_t.cpu().numpy()
\ No newline at end of file
+            with self._phase("transfer"):
+                return frame_t.cpu().numpy()
+
+    def _render_inplace(self, img_size):
+        """Same rasterization as render, reusing one set of frame buffers"""
+        device = self.pos.device
+        if self.frame_t is None:
+            self.frame_t = torch.zeros(img_size, dtype=torch.uint8, device=device)
+            self.color = torch.tensor([0, 255, 0], dtype=torch.uint8, device=device)
+            self.frame_host = torch.empty((800, 800, 3), dtype=torch.uint8, pin_memory=device.type == "cuda")
+
+        with self._phase("rasterize"):
+            pos = self.pos if self.batch is None else self.pos[self.render_index]
+            pix, pix_idx = self._pixel_buffers()
+            pix[0].copy_(pos[:, :, 0]).div_(self.height).mul_(img_size[0] - 700).add_(690).clamp_(0, img_size[0] - 1)
+            pix[1].copy_(pos[:, :, 1]).div_(self.width).mul_(img_size[1] - 20).add_(10).clamp_(0, img_size[1] - 1)
+            pix_idx.copy_(pix)
+            y, x = pix_idx
+
+            self.frame_t.zero_()
+            self.frame_t[y, x] = self.color
+        with self._phase("transfer"):
+            self.frame_host.copy_(self.frame_t[2:802, 2:802])
+        return self.frame_host.numpy()
+
+    def _pixel_buffers(self):
+        """Float and integer [2, H, W] pixel coordinate buffers, created once"""
+        if self.pix is None:
+            self.pix = torch.empty(2, self.height, self.width, device=self.pos.device)
+            self.pix_idx = torch.empty(2, self.height, self.width, dtype=torch.long, device=self.pos.device)
+        return self.pix, self.pix_idx
+
+    def render_into(self, pixels, color, mode="points", color_by=None, shifts=(16, 8, 0)):
+        """Rasterize straight into a display-resolution pixel buffer
+
+        `pixels` is an int32 [x, y] tensor in pygame surfarray layout (e.g. a view of
+        pixels2d) with a one-pixel border on every side that catches off-screen
+        particles, and `color` is the surface-mapped colour. The view is the same as
+        render(): flipped vertically and scaled to fill the buffer. When the buffer
+        is on another device the frame is drawn on the cloth's device and copied
+        over once.
+
+        mode="mesh" draws every horizontal and vertical spring as a line instead of
+        one pixel per particle. It can colour the lines by "strain" or "velocity"
+        on a green-to-red ramp packed with the surface's RGB `shifts`.
+        """
+        with torch.no_grad():
+            device = self.pos.device
+            if pixels.device != device:
+                if self.frame_dev is None or self.frame_dev.shape != pixels.shape:
+                    self.frame_dev = torch.empty(pixels.shape, dtype=pixels.dtype, device=device)
+                frame = self.frame_dev
+            else:
+                frame = pixels
+            w, h = frame.shape[0] - 2, frame.shape[1] - 2
+
+            # Same mapping as the cropped 800x800 render, scaled to w x h
+            with self._phase("rasterize"):
+                pos = self.pos if self.batch is None else self.pos[self.render_index]
+                pix, pix_idx = self._pixel_buffers()
+                pix[0].copy_(pos[:, :, 1]).mul_(784 / self.width).add_(8).mul_(w / 800)
+                pix[1].copy_(pos[:, :, 0]).mul_(-104 / self.height).add_(112).mul_(h / 800)
+
+                frame.zero_()
+                if mode == "mesh":
+                    x, y, color = self._mesh_pixels(pix, w, h, color, color_by, shifts)
+                else:
+                    pix.floor_()
+                    pix[0].clamp_(-1, w)
+                    pix[1].clamp_(-1, h)
+                    pix_idx.copy_(pix).add_(1)
+                    x, y = pix_idx
+                frame[x, y] = color
+
+            if frame is not pixels:
+                with self._phase("transfer"):
+                    pixels.copy_(frame)
+            return pixels
+
+    def _mesh_pixels(self, pix, w, h, color, color_by, shifts):
+        """Pixel coordinates and colours of every spring, all segments rasterized at once"""
+        # Segment end points: horizontal springs, then vertical springs
+        start = torch.cat([pix[:, :, :-1].reshape(2, -1), pix[:, :-1, :].reshape(2, -1)], dim=1)
+        seg = torch.cat([pix[:, :, 1:].reshape(2, -1), pix[:, 1:, :].reshape(2, -1)], dim=1) - start
+
+        # One sample per pixel of segment length (capped), so cost follows the drawn length
+        length = torch.hypot(seg[0], seg[1]).nan_to_num_(0, 64, 0)
+        counts = length.ceil_().clamp_(max=64).long().add_(1)
+        ids = torch.repeat_interleave(counts)
+        first = torch.cumsum(counts, 0).sub_(counts)
+        t = (torch.arange(len(ids), device=pix.device) - first[ids]) / (counts[ids] - 1).clamp_(min=1)
+        points = torch.addcmul(start.index_select(1, ids), seg.index_select(1, ids), t).floor_()
+        points[0].clamp_(-1, w)
+        points[1].clamp_(-1, h)
+        x, y = points.long().add_(1)
+        if color_by is None:
+            return x, y, color
+
+        pos = self.pos if self.batch is None else self.pos[self.render_index]
+        if color_by == "strain":
+            length = torch.cat([torch.linalg.vector_norm(pos[:, 1:] - pos[:, :-1], dim=-1).flatten(),
+                                torch.linalg.vector_norm(pos[1:] - pos[:-1], dim=-1).flatten()])
+            value = (length / self.spacing - 1).abs()
+        elif color_by == "velocity":
+            if self.method in ("euler", "implicit"):
+                velo = self.velo if self.batch is None else self.velo[self.render_index]
+            else:
+                velo = pos - (self.prev_pos if self.batch is None else self.prev_pos[self.render_index])
+            speed = torch.linalg.vector_norm(velo, dim=-1)
+            value = torch.cat([(speed[:, 1:] + speed[:, :-1]).flatten(), (speed[1:] + speed[:-1]).flatten()])
+        value = value / (value.amax() + 1e-6)
+
+        # Green-to-red ramp packed into the surface pixel format
+        red = (value * 255).nan_to_num_(255).to(torch.int32)
+        colors = (red << shifts[0]) | ((255 - red) << shifts[1])
+        return x, y, colors[ids]
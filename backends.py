@@ -0,0 +1,235 @@
+import time
+
+import numpy as np
+import torch
+
+# Step backends selectable with Cloth(backend=...) and Cloth.set_backend
+BACKENDS = ("eager", "compile", "numpy")
+
+
+def make_backend(name):
+    if name == "eager":
+        return EagerBackend()
+    if name == "compile":
+        return CompiledBackend()
+    if name == "numpy":
+        return NumpyBackend()
+    raise ValueError(f"unknown backend {name!r}, expected one of {', '.join(BACKENDS)}")
+
+
+class EagerBackend:
+    """The torch kernels in Cloth, run op by op"""
+
+    name = "eager"
+
+    def supports(self, cloth):
+        return True
+
+    def step(self, cloth, dt):
+        cloth._integrate(dt)
+
+
+class CompiledBackend:
+    """Cloth._integrate compiled with torch.compile
+
+    Nothing is imported or compiled until the first step, which pays for both;
+    load_seconds records how long that took. Changing method, device or grid
+    size makes torch.compile retrace on the next step. pbd stays eager: its
+    unrolled constraint sweeps take long to compile and run slower compiled.
+    """
+
+    name = "compile"
+
+    def __init__(self, mode=None):
+        self.mode = mode
+        self.fn = None
+        self.load_seconds = None
+
+    def supports(self, cloth):
+        return cloth.method != "pbd"
+
+    def step(self, cloth, dt):
+        if not self.supports(cloth):
+            cloth._integrate(dt)
+        elif self.fn is None:
+            start = time.perf_counter()
+            self.fn = torch.compile(cloth._integrate, mode=self.mode)
+            self.fn(dt)
+            self.load_seconds = time.perf_counter() - start
+        else:
+            self.fn(dt)
+
+
+def _fused_step(pos, prev, velo, out, neighbors, inv_mass, stiffness, weight, inv_mass_dt, alpha, decay,
+                energy, energy_l, dt, verlet):
+    """Force, integration and energy limiting for [B, H, W, 2] float32 state in two sweeps
+
+    Written for numba.njit. The first sweep writes the unlimited displacement
+    into `out`, the second turns it into the new positions. For verlet `out` may
+    be `prev`: each element of prev is read before it is overwritten.
+    """
+    batch, height, width, _ = pos.shape
+    pp = 0.8 if verlet else 1.0
+    for b in range(batch):
+        k = stiffness[b]
+        e = 0.0
+        for i in range(height):
+            for j in range(width):
+                for c in range(2):
+                    p = pos[b, i, j, c]
+                    f = -neighbors[i, j] * p
+                    if i > 0:
+                        f += pos[b, i - 1, j, c]
+                    if i < height - 1:
+                        f += pos[b, i + 1, j, c]
+                    if j > 0:
+                        f += pos[b, i, j - 1, c]
+                    if j < width - 1:
+                        f += pos[b, i, j + 1, c]
+                    f *= k
+                    if c == 0:
+                        f -= weight[b]
+                    f *= inv_mass[i, j]
+                    if verlet:
+                        d = p - prev[b, i, j, c] + f * inv_mass_dt[b] * dt
+                    else:
+                        d = velo[b, i, j, c] * dt
+                        velo[b, i, j, c] += f * inv_mass_dt[b]
+                    out[b, i, j, c] = d
+                    e += d * d
+
+        energy_n = min(e, energy_l[b]) * decay[b]
+        energy_n = energy_n * pp + e * (1 - pp)
+        scale = energy_n / (e + 1e-6)
+        energy_l[b] += (energy_n - energy_l[b]) * alpha[b]
+        energy[b] = e
+        for i in range(height):
+            for j in range(width):
+                for c in range(2):
+                    out[b, i, j, c] = pos[b, i, j, c] + out[b, i, j, c] * scale
+
+
+class NumpyBackend:
+    """Verlet and Euler steps on NumPy views of the cloth's CPU tensors
+
+    With Numba installed the whole step is one fused, compiled loop
+    (_fused_step); without it a vectorized NumPy version runs instead. Numba is
+    imported and the loop compiled (or loaded from Numba's on-disk cache) on the
+    first step. pbd, implicit and non-CPU cloths are not covered: they are
+    stepped by the eager kernels.
+    """
+
+    name = "numpy"
+
+    def __init__(self, use_numba=True):
+        self.use_numba = use_numba
+        self.kernel = None
+        self.jit = None
+        self.load_seconds = None
+        self.newpos = None
+        self.padded = None
+
+    def supports(self, cloth):
+        return cloth.pos.device.type == "cpu" and cloth.method in ("verlet", "euler") and cloth.pos.dtype == torch.float32
+
+    def _load(self):
+        start = time.perf_counter()
+        self.jit = False
+        if self.use_numba:
+            try:
+                import numba
+            except ImportError:
+                pass
+            else:
+                self.kernel = numba.njit(cache=True)(_fused_step)
+                self.jit = True
+        self.load_seconds = time.perf_counter() - start
+
+    def step(self, cloth, dt):
+        if not self.supports(cloth):
+            cloth._integrate(dt)
+            return
+        if self.jit is None:
+            self._load()
+
+        with cloth._phase("integrate"):
+            shape = (cloth.batch or 1, cloth.height, cloth.width, 2)
+            verlet = cloth.method == "verlet"
+            if verlet:
+                # prev_pos is dead once read, so it takes the new positions
+                target = cloth.prev_pos
+            else:
+                if self.newpos is None or self.newpos.shape != cloth.pos.shape:
+                    self.newpos = torch.empty_like(cloth.pos)
+                target = self.newpos
+            pos = cloth.pos.numpy().reshape(shape)
+            # The method only keeps one of prev_pos and velo; pos stands in for the other
+            prev = cloth.prev_pos.numpy().reshape(shape) if verlet else pos
+            velo = pos if verlet else cloth.velo.numpy().reshape(shape)
+            out = target.numpy().reshape(shape)
+            energy = cloth.energy.numpy().reshape(-1)
+            energy_l = cloth.energy_l.numpy().reshape(-1)
+
+            batch = shape[0]
+            mass = _vector(cloth.mass, batch)
+            stiffness = _vector(cloth.stiffness, batch)
+            weight = _vector(cloth.gravity, batch) * mass
+            inv_mass_dt = np.float32(dt) / mass
+            alpha, decay = _vector(cloth.alpha, batch), _vector(cloth.decay, batch)
+            neighbors = cloth.neighbors.numpy()[..., 0]
+            inv_mass = cloth.inv_mass.numpy()[..., 0]
+
+            if self.kernel is not None:
+                self.kernel(pos, prev, velo, out, neighbors, inv_mass, stiffness, weight, inv_mass_dt, alpha, decay,
+                            energy, energy_l, np.float32(dt), verlet)
+            else:
+                self._step_vectorized(pos, prev, velo, out, neighbors, inv_mass, stiffness, weight, inv_mass_dt,
+                                      alpha, decay, energy, energy_l, np.float32(dt), verlet)
+
+            if verlet:
+                cloth.prev_pos, cloth.pos = cloth.pos, target
+            else:
+                self.newpos, cloth.pos = cloth.pos, target
+
+    def _step_vectorized(self, pos, prev, velo, out, neighbors, inv_mass, stiffness, weight, inv_mass_dt, alpha,
+                         decay, energy, energy_l, dt, verlet):
+        """_fused_step with whole-array NumPy operations"""
+        batch, height, width, _ = pos.shape
+        if self.padded is None or self.padded.shape != (batch, height + 2, width + 2, 2):
+            self.padded = np.zeros((batch, height + 2, width + 2, 2), dtype=np.float32)
+            self.force = np.empty(pos.shape, dtype=np.float32)
+        padded, force = self.padded, self.force
+        padded[:, 1:-1, 1:-1] = pos
+        np.add(padded[:, :-2, 1:-1], padded[:, 2:, 1:-1], out=force)
+        force += padded[:, 1:-1, :-2]
+        force += padded[:, 1:-1, 2:]
+        force -= neighbors[..., None] * pos
+        force *= stiffness[:, None, None, None]
+        force[..., 0] -= weight[:, None, None]
+        force *= inv_mass[..., None]
+        force *= inv_mass_dt[:, None, None, None]
+
+        if verlet:
+            np.subtract(pos, prev, out=out)
+            force *= dt
+            out += force
+        else:
+            np.multiply(velo, dt, out=out)
+            velo += force
+
+        e = np.einsum("bijc,bijc->b", out, out)
+        pp = 0.8 if verlet else 1.0
+        energy_n = np.minimum(e, energy_l) * decay
+        energy_n = energy_n * pp + e * (1 - pp)
+        scale = energy_n / (e + 1e-6)
+        energy_l += (energy_n - energy_l) * alpha
+        energy[:] = e
+        out *= scale.astype(np.float32)[:, None, None, None]
+        out += pos
+
+
+def _vector(value, batch):
+    """A scalar or per-instance parameter as a float32 array of length batch"""
+    if torch.is_tensor(value):
+        value = value.detach().cpu().numpy()
+    return np.ascontiguousarray(np.broadcast_to(np.asarray(value, dtype=np.float32).reshape(-1), (batch,)))
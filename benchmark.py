@@ -0,0 +1,228 @@
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+
+from Cloth import Cloth, check_dtype
+
+DEFAULT_SIZES = ["80x160", "256x256", "512x512", "1024x1024", "2048x2048"]
+DEFAULT_METHODS = ["verlet", "euler", "pbd", "implicit"]
+DEFAULT_KERNELS = ["stencil"]
+DEFAULT_BACKENDS = ["eager"]
+DEFAULT_DTYPES = ["float32"]
+
+
+def parse_size(text):
+    """Parse a HEIGHTxWIDTH string"""
+    height, width = text.lower().split("x")
+    return int(height), int(width)
+
+
+def sync(device):
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def run_case(height, width, device, method, options, steps, warmup, dt, render):
+    """Time `steps` fixed-timestep updates of one Cloth configuration
+
+    `options` holds extra Cloth keyword arguments (force_kernel, preallocate,
+    backend, dtype, ...). Returns None when the backend does not cover the case.
+    """
+    if device.startswith("cuda"):
+        torch.cuda.reset_peak_memory_stats()
+    t0 = time.perf_counter()
+    cloth = Cloth(height, width, 1.0, 30, 0.01, device=device, method=method, **options)
+    construct = time.perf_counter() - t0
+    if not cloth.stepper.supports(cloth):
+        return None
+
+    # The first step includes whatever the backend loads or compiles lazily
+    t0 = time.perf_counter()
+    cloth.step(dt)
+    sync(device)
+    first_step = time.perf_counter() - t0
+
+    for _ in range(warmup):
+        cloth.step(dt)
+        if render:
+            cloth.render()
+    sync(device)
+
+    latency = np.empty(steps)
+    start = time.perf_counter()
+    for i in range(steps):
+        t0 = time.perf_counter()
+        cloth.step(dt)
+        if render:
+            cloth.render()
+        sync(device)
+        latency[i] = time.perf_counter() - t0
+    total = time.perf_counter() - start
+
+    if device.startswith("cuda"):
+        peak_bytes = torch.cuda.max_memory_allocated()
+    else:
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        peak_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_bytes *= 1 if sys.platform == "darwin" else 1024
+
+    latency_ms = latency * 1e3
+    return {
+        "height": height,
+        "width": width,
+        "particles": height * width,
+        "device": device,
+        "method": method,
+        **options,
+        "render": render,
+        "steps": steps,
+        "steps_per_sec": steps / total,
+        "cloth_steps_per_sec": steps * (options.get("batch") or 1) / total,
+        "particles_per_sec": steps * height * width * (options.get("batch") or 1) / total,
+        "startup_ms": {"construct": construct * 1e3, "first_step": first_step * 1e3},
+        "latency_ms": {
+            "mean": float(latency_ms.mean()),
+            "min": float(latency_ms.min()),
+            "p50": float(np.percentile(latency_ms, 50)),
+            "p90": float(np.percentile(latency_ms, 90)),
+            "p99": float(np.percentile(latency_ms, 99)),
+            "max": float(latency_ms.max()),
+        },
+        "peak_memory_bytes": int(peak_bytes),
+        "bytes_per_particle": cloth.bytes_per_particle(),
+    }
+
+
+def import_time():
+    """Seconds a fresh interpreter takes to import the Cloth module"""
+    code = "import time; t = time.perf_counter(); import Cloth; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout)
+
+
+def product_options(**choices):
+    """Every combination of the given Cloth keyword argument choices"""
+    keys = list(choices)
+    return [dict(zip(keys, values)) for values in itertools.product(*choices.values())]
+
+
+def run_isolated(args):
+    """Run a case in a fresh process so peak memory is not shared between cases"""
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(run_case, args)
+
+
+def case_key(result):
+    return (result["height"], result["width"], result["device"], result["method"],
+            result.get("force_kernel", "slice"), result.get("preallocate", False), result.get("batch"),
+            result.get("self_collision", False), result.get("backend", "eager"),
+            result.get("dtype", "float32"), result["render"])
+
+
+def compare(results, baseline, threshold):
+    """Return the cases whose throughput dropped by more than `threshold` versus baseline"""
+    previous = {case_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        change = result["steps_per_sec"] / old["steps_per_sec"] - 1
+        if change < -threshold:
+            regressions.append({"case": case_key(result), "old": old["steps_per_sec"],
+                                "new": result["steps_per_sec"], "change": change})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Cloth benchmark")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="grid sizes as HEIGHTxWIDTH")
+    parser.add_argument("--devices", nargs="+", default=None, help="default: cpu, plus cuda when available")
+    parser.add_argument("--methods", nargs="+", default=DEFAULT_METHODS)
+    parser.add_argument("--force-kernels", nargs="+", default=DEFAULT_KERNELS, help="stencil and/or slice")
+    parser.add_argument("--preallocate", nargs="+", type=int, default=[0], help="0 and/or 1")
+    parser.add_argument("--batch", nargs="+", type=int, default=[1], help="cloths stepped together")
+    parser.add_argument("--self-collision", nargs="+", type=int, default=[0], help="0 and/or 1")
+    parser.add_argument("--backends", nargs="+", default=DEFAULT_BACKENDS, help="eager, compile and/or numpy")
+    parser.add_argument("--dtypes", nargs="+", default=DEFAULT_DTYPES, help="float16, bfloat16, float32 and/or float64 (half precision runs implicit only)")
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--dt", type=float, default=0.1)
+    parser.add_argument("--render", action="store_true", help="also rasterize a frame after every step")
+    parser.add_argument("--no-isolate", action="store_true", help="run all cases in this process")
+    parser.add_argument("--out", default=None, help="write JSON here instead of stdout")
+    parser.add_argument("--compare", default=None, help="baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    devices = args.devices or (["cpu", "cuda"] if torch.cuda.is_available() else ["cpu"])
+
+    results = []
+    for size in args.sizes:
+        height, width = parse_size(size)
+        for device in devices:
+            for method in args.methods:
+                for options in product_options(force_kernel=args.force_kernels,
+                                               preallocate=[bool(p) for p in args.preallocate],
+                                               batch=[b if b > 1 else None for b in args.batch],
+                                               self_collision=[bool(c) for c in args.self_collision],
+                                               backend=args.backends,
+                                               dtype=args.dtypes):
+                    label = " ".join(f"{k}={v}" for k, v in options.items())
+                    try:
+                        check_dtype(method, options.get("dtype", "float32"))
+                    except ValueError as err:
+                        print(f"{height}x{width} {device} {method} {label}: {err}, skipped", file=sys.stderr)
+                        continue
+                    case = (height, width, device, method, options, args.steps, args.warmup, args.dt, args.render)
+                    result = run_case(*case) if args.no_isolate else run_isolated(case)
+                    if result is None:
+                        print(f"{height}x{width} {device} {method} {label}: not supported by the backend, skipped", file=sys.stderr)
+                        continue
+                    print(f"{height}x{width} {device} {method} {label}: {result['cloth_steps_per_sec']:.1f} cloth steps/s, "
+                          f"p50 {result['latency_ms']['p50']:.2f} ms, first step {result['startup_ms']['first_step']:.0f} ms, "
+                          f"{result['bytes_per_particle']:.0f} B/particle",
+                          file=sys.stderr)
+                    results.append(result)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "cpu_count": mp.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+            "cuda": torch.cuda.get_device_name() if torch.cuda.is_available() else None,
+            "import_seconds": import_time(),
+        },
+        "results": results,
+    }
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            report["regressions"] = compare(results, json.load(f), args.threshold)
+        status = 1 if report["regressions"] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
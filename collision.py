@@ -0,0 +1,141 @@
+import torch
+
+
+class Sphere:
+    """Circular obstacle; particles inside are pushed out to its surface"""
+
+    def __init__(self, center, radius):
+        self.center = center  # (y, x)
+        self.radius = radius
+
+    def project(self, pos):
+        center = torch.as_tensor(self.center, dtype=pos.dtype, device=pos.device)
+        d = pos - center
+        dist = torch.linalg.vector_norm(d, dim=-1, keepdim=True)
+        surface = center + d / dist.clamp_min(1e-12) * self.radius
+        return torch.where(dist < self.radius, surface, pos)
+
+
+class Box:
+    """Axis-aligned rectangle; particles inside leave through the nearest face"""
+
+    def __init__(self, lo, hi):
+        self.lo = lo  # (y, x) corners
+        self.hi = hi
+
+    def project(self, pos):
+        lo = torch.as_tensor(self.lo, dtype=pos.dtype, device=pos.device)
+        hi = torch.as_tensor(self.hi, dtype=pos.dtype, device=pos.device)
+        inside = ((pos > lo) & (pos < hi)).all(dim=-1, keepdim=True)
+        # Distance to the four faces: [..., 4] as (lo_y, lo_x, hi_y, hi_x)
+        gaps = torch.cat([pos - lo, hi - pos], dim=-1)
+        face = gaps.argmin(dim=-1, keepdim=True)
+        axis = face % 2
+        target = torch.where(face < 2, lo[axis], hi[axis])
+        out = pos.scatter(-1, axis, target)
+        return torch.where(inside, out, pos)
+
+
+class Floor:
+    """Particles may not go below height y (gravity pulls towards -y)"""
+
+    def __init__(self, y=0.0):
+        self.y = y
+
+    def project(self, pos):
+        out = pos.clone()
+        out[..., 0].clamp_(min=self.y)
+        return out
+
+
+# Large primes of the usual spatial hash
+_PRIMES = (73856093, 19349663)
+# Own cell first, then half of the 8 surrounding cells: every pair of adjacent
+# cells is visited from exactly one side
+_OFFSETS = [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+class SpatialHash:
+    """Pushes apart particles closer than `distance` that are not spring neighbours
+
+    Particles are binned into square cells of side `distance` and sorted by cell
+    hash once per step, all on the positions' device, with a table of where each
+    hash bucket starts in the sorted order; each particle then only
+    tests the particles of its own cell and four of the cells around it (each
+    pair of neighbouring cells is visited once), so the cost stays close to
+    linear in the particle count. Batched cloths get disjoint key ranges.
+    """
+
+    def __init__(self, distance):
+        self.distance = distance
+        # Counters from the last solve and over the lifetime of the hash
+        self.candidate_pairs = 0
+        self.contacts = 0
+        self.total_candidate_pairs = 0
+        self.total_contacts = 0
+
+    def _hash(self, cy, cx, batch_id, size):
+        return ((cy * _PRIMES[0]) ^ (cx * _PRIMES[1])) & (size - 1) | batch_id * size
+
+    def solve(self, pos, inv_mass):
+        """Position corrections for pos [..., H, W, 2]; inv_mass [H, W, 1] is 0 at pins"""
+        height, width = pos.shape[-3:-1]
+        n = height * width
+        points = pos.reshape(-1, 2)
+        m = len(points)
+        device = points.device
+        size = 1 << max(n - 1, 1).bit_length()
+
+        idx = torch.arange(m, device=device)
+        batch_id = idx // n
+        cell = torch.floor(points / self.distance).long()
+        keys = self._hash(cell[:, 0], cell[:, 1], batch_id, size)
+        order = torch.sort(keys).indices
+        # Particles per hash bucket and where each bucket starts in the sorted order
+        bucket = torch.bincount(keys, minlength=size * (m // n))
+        bucket_start = torch.cumsum(bucket, 0).sub_(bucket)
+
+        # Range of sorted particles in each queried cell
+        offsets = torch.tensor(_OFFSETS, device=device)
+        query = cell[None] + offsets[:, None]
+        qkeys = self._hash(query[..., 0], query[..., 1], batch_id, size).flatten()
+        start = bucket_start.index_select(0, qkeys)
+        counts = bucket.index_select(0, qkeys)
+
+        # Expand the ranges into (i, j) candidate pairs, as in Cloth._mesh_pixels
+        ids = torch.repeat_interleave(counts)
+        first = torch.cumsum(counts, 0).sub_(counts)
+        slot = (start - first).index_select(0, ids).add_(torch.arange(len(ids), device=device))
+        j = order.index_select(0, slot)
+        i = ids % m
+        # Hash collisions can alias other cells, so check the cell; pairs within the
+        # own cell (the first m queries) are seen from both sides, keep them once
+        keep = (cell.index_select(0, j) == query.reshape(-1, 2).index_select(0, ids)).all(dim=-1)
+        keep &= (ids >= m) | (i < j)
+        # Springs already keep grid neighbours apart: same row and next column, or
+        # same column and next row (i and j are in the same batched cloth)
+        gap = (j - i).abs_()
+        keep &= (gap != width) & ((gap != 1) | (torch.maximum(i, j) % width == 0))
+        keep = keep.nonzero()[:, 0]
+        i, j = i.index_select(0, keep), j.index_select(0, keep)
+
+        d = points.index_select(0, j) - points.index_select(0, i)
+        dist = torch.linalg.vector_norm(d, dim=-1, keepdim=True)
+        hit = (dist < self.distance)[:, 0].nonzero()[:, 0]
+        self.candidate_pairs = len(i)
+        self.total_candidate_pairs += len(i)
+        i, j, d, dist = (t.index_select(0, hit) for t in (i, j, d, dist))
+        self.contacts = len(i)
+        self.total_contacts += len(i)
+
+        w = inv_mass.expand(*pos.shape[:-1], 1).reshape(-1, 1)
+        w_i, w_j = w.index_select(0, i), w.index_select(0, j)
+        push = d / dist.clamp_min(1e-12) * (self.distance - dist) / (w_i + w_j).clamp_min(1e-12)
+        corr = torch.zeros_like(points)
+        corr.index_add_(0, i, push * w_i, alpha=-1)
+        corr.index_add_(0, j, push * w_j)
+        # Jacobi: average over each particle's contacts
+        hits = torch.zeros(m, 1, device=device, dtype=points.dtype)
+        hits.index_add_(0, i, torch.ones_like(w_i))
+        hits.index_add_(0, j, torch.ones_like(w_j))
+        return (corr / hits.clamp_min(1)).view(pos.shape)
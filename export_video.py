@@ -0,0 +1,163 @@
+import argparse
+import queue
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from Cloth import Cloth, check_dtype
+from lod import LODCloth
+from settle import SETTLE_METHODS, SettledCache
+
+# Green in the 0x00RRGGBB packing below, which is BGRA byte order in memory
+GREEN = 0x00FF00
+
+
+class VideoEncoder(threading.Thread):
+    """Encodes frames with cv2.VideoWriter on a background thread
+
+    Frames are int32 [h + 2, w + 2] buffers packed 0x00RRGGBB (BGRA bytes) with the
+    one-pixel border render_into draws off-screen particles into. Producers take
+    a buffer from frame_buffer(), draw into it and submit() it; the queue between
+    the two sides is bounded, so a slow encoder holds the simulation back instead
+    of piling up frames.
+    """
+
+    def __init__(self, path, size, fps=30, fourcc="mp4v", queue_size=8):
+        super().__init__(daemon=True)
+        self.size = size  # (w, h)
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+        if not self.writer.isOpened():
+            raise RuntimeError(f"cannot open {path} for writing with fourcc {fourcc}")
+        w, h = size
+        self.pending = queue.Queue(maxsize=queue_size)
+        self.free = queue.Queue()
+        for _ in range(queue_size + 2):
+            self.free.put(torch.zeros(h + 2, w + 2, dtype=torch.int32))
+        self.frames_written = 0
+        # Seconds the producer spent waiting for a free buffer
+        self.wait_time = 0.0
+        self.encode_time = 0.0
+        self.error = None
+
+    def frame_buffer(self):
+        """A free frame buffer to draw into, waiting for the encoder if all are queued"""
+        t0 = time.perf_counter()
+        buf = self.free.get()
+        self.wait_time += time.perf_counter() - t0
+        return buf
+
+    def submit(self, buf):
+        if self.error is not None:
+            raise RuntimeError("video encoder failed") from self.error
+        self.pending.put(buf)
+
+    def run(self):
+        bgr = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+        while True:
+            buf = self.pending.get()
+            if buf is None:
+                break
+            t0 = time.perf_counter()
+            try:
+                bgra = buf[1:-1, 1:-1].numpy().view(np.uint8).reshape(self.size[1], self.size[0], 4)
+                cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=bgr)
+                self.writer.write(bgr)
+                self.frames_written += 1
+            except Exception as e:
+                self.error = e
+            self.encode_time += time.perf_counter() - t0
+            self.free.put(buf)
+
+    def close(self):
+        """Encode the queued frames and finalize the file"""
+        self.pending.put(None)
+        self.join()
+        self.writer.release()
+        if self.error is not None:
+            raise RuntimeError("video encoder failed") from self.error
+
+
+def export(cloth, path, frames, dt, substeps=1, size=(800, 800), fps=30, mode="points", color_by=None,
+           fourcc="mp4v", queue_size=8):
+    """Step the cloth at a fixed timestep and encode one frame per step() call
+
+    Returns timing statistics. Simulation and rasterization run on this thread
+    while the encoder thread compresses earlier frames.
+    """
+    encoder = VideoEncoder(path, size, fps, fourcc, queue_size)
+    encoder.start()
+    start = time.perf_counter()
+    try:
+        for _ in range(frames):
+            cloth.step(dt, substeps)
+            buf = encoder.frame_buffer()
+            # render_into wants the surfarray [x, y] layout; the transposed view keeps
+            # the memory in the [y, x] row order the encoder reads
+            cloth.render_into(buf.t(), GREEN, mode=mode, color_by=color_by)
+            encoder.submit(buf)
+    finally:
+        encoder.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": encoder.frames_written,
+        "seconds": elapsed,
+        "fps": encoder.frames_written / elapsed,
+        "realtime_factor": encoder.frames_written / fps / elapsed,
+        "producer_wait_seconds": encoder.wait_time,
+        "encode_seconds": encoder.encode_time,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a Cloth run to a video file without a display")
+    parser.add_argument("out", help="output video, e.g. cloth.mp4")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--dt", type=float, default=0.2, help="fixed timestep of each substep")
+    parser.add_argument("--substeps", type=int, default=1, help="simulation steps per frame")
+    parser.add_argument("--grid", default="80x160", help="cloth HEIGHTxWIDTH")
+    parser.add_argument("--resolution", default="800x800", help="video WIDTHxHEIGHT")
+    parser.add_argument("--method", default="verlet")
+    parser.add_argument("--backend", default="eager", help="eager, compile or numpy")
+    parser.add_argument("--device", default="auto", help="cpu, cuda, or auto to pick cuda when available")
+    parser.add_argument("--dtype", default="float32", help="float32 or float64 state; float16 or bfloat16 with --method implicit")
+    parser.add_argument("--mode", default="points", help="points or mesh")
+    parser.add_argument("--color-by", default=None, help="strain or velocity (mesh mode)")
+    parser.add_argument("--fourcc", default="mp4v")
+    parser.add_argument("--settled", action="store_true", help="start from the cached settled state")
+    parser.add_argument("--lod", type=int, default=1, help="simulate a grid this many times coarser and upsample it")
+    parser.add_argument("--refine", type=int, default=0, help="fine-level correction sweeps per frame with --lod")
+    args = parser.parse_args(argv)
+    if args.lod > 1 and args.settled:
+        parser.error("--settled cannot be combined with --lod")
+    if args.settled and args.method not in SETTLE_METHODS:
+        parser.error(f"--settled needs one of the methods that settle: {', '.join(SETTLE_METHODS)}")
+    try:
+        check_dtype(args.method, args.dtype)
+    except ValueError as err:
+        parser.error(str(err))
+
+    height, width = (int(v) for v in args.grid.lower().split("x"))
+    size = tuple(int(v) for v in args.resolution.lower().split("x"))
+    options = dict(device=args.device, method=args.method, preallocate=args.method in ("verlet", "euler"),
+                   backend=args.backend, dtype=args.dtype)
+    if args.lod > 1:
+        cloth = LODCloth(height, width, 1.0, 30, 0.01, ratio=args.lod, refine=args.refine, **options)
+    else:
+        cloth = Cloth(height, width, 1.0, 30, 0.01, **options)
+    if args.settled:
+        SettledCache().load(cloth)
+
+    stats = export(cloth, args.out, args.frames, args.dt, args.substeps, size, args.fps, args.mode, args.color_by, args.fourcc)
+    print(f"{stats['frames']} frames in {stats['seconds']:.2f} s ({stats['fps']:.1f} fps, "
+          f"{stats['realtime_factor']:.1f}x real time); encoder busy {stats['encode_seconds']:.2f} s, "
+          f"simulation waited {stats['producer_wait_seconds']:.2f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
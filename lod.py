@@ -0,0 +1,202 @@
+import argparse
+import math
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from Cloth import Cloth
+
+INTERPOLATIONS = ("bilinear", "bicubic")
+
+
+def resample(field, height, width, mode="bilinear"):
+    """Resample a [..., h, w, 2] grid field onto height x width nodes, corners aligned"""
+    lead = field.shape[:-3]
+    # A contiguous planar copy: interpolate is several times slower on the channels-last view
+    planar = field.reshape(-1, *field.shape[-3:]).permute(0, 3, 1, 2).contiguous()
+    out = F.interpolate(planar, size=(height, width), mode=mode, align_corners=True)
+    return out.permute(0, 2, 3, 1).reshape(*lead, height, width, 2)
+
+
+def _scaled(value, factor):
+    """A scalar or per-instance Cloth parameter times factor"""
+    return value * factor if np.isscalar(value) else [v * factor for v in value]
+
+
+class LODCloth:
+    """Simulates a coarse Cloth and shows it upsampled onto the full height x width grid
+
+    The coarse grid has about 1/ratio of the rows and of the columns, so a step
+    costs about 1/ratio^2 as much. Particle masses grow with the area each coarse
+    particle stands for; the zero-rest-length springs need the same stiffness at
+    any spacing. Pins of the fine grid are carried over to the nearest coarse
+    particles and enforced exactly on the upsampled grid.
+
+    Once per tick()/step() call the coarse positions are interpolated ("bilinear"
+    or the smoother "bicubic") onto self.fine, a Cloth that is rendered but not
+    stepped. With refine=k, k damped-Jacobi sweeps of the fine springs then
+    correct the upsampled grid. A few sweeps only remove the fine-level,
+    high-frequency part of the residual (kinks between coarse particles, detail
+    around the pins) and leave the smooth shape the coarse grid simulates alone;
+    they start from the plain upsampled grid every frame, so nothing accumulates.
+    One or two sweeps help, more relax towards a static equilibrium the energy
+    limiter never lets the cloth reach.
+    """
+
+    def __init__(self, height, width, spacing, mass, gravity, ratio=2, interpolation="bilinear", refine=0,
+                 init_energy=1e3, **kwargs):
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f"interpolation must be one of {', '.join(INTERPOLATIONS)}")
+        self.ratio = ratio
+        self.interpolation = interpolation
+        self.refine = refine
+        self.fine = Cloth(height, width, spacing, mass, gravity, init_energy=init_energy, **kwargs)
+
+        coarse_h = max(2, math.ceil((height - 1) / ratio) + 1)
+        coarse_w = max(2, math.ceil((width - 1) / ratio) + 1)
+        scale_h, scale_w = (height - 1) / (coarse_h - 1), (width - 1) / (coarse_w - 1)
+        self.coarse = Cloth(coarse_h, coarse_w, spacing * scale_w, _scaled(mass, scale_h * scale_w), gravity,
+                            init_energy=_scaled(init_energy, coarse_h * coarse_w / (height * width)), **kwargs)
+        with torch.no_grad():
+            # Start from the fine grid's layout, sampled at the coarse nodes
+            self.coarse.pos.copy_(resample(self.fine.pos, coarse_h, coarse_w))
+            if self.coarse.prev_pos is not None:
+                self.coarse.prev_pos.copy_(self.coarse.pos)
+            rows, cols = torch.nonzero(self.fine.pinned[..., 0], as_tuple=True)
+            self.coarse.clear_pins()
+            # Each fine pin holds the nearest coarse particle at the fine pin's own target
+            self.coarse.pin((torch.round(rows / scale_h).long(), torch.round(cols / scale_w).long()),
+                            self.fine.pin_target[..., rows, cols, :])
+        self._update()
+
+    @property
+    def pos(self):
+        return self.fine.pos
+
+    @property
+    def steps(self):
+        return self.coarse.steps
+
+    @property
+    def batch(self):
+        return self.fine.batch
+
+    @property
+    def render_index(self):
+        return self.fine.render_index
+
+    @property
+    def profiler(self):
+        return self.coarse.profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self.coarse.profiler = profiler
+        self.fine.profiler = profiler
+
+    def tick(self, substeps=1):
+        """Advance the coarse physics by the (scaled) wall-clock time since the last call"""
+        self.coarse.tick(substeps)
+        self._update()
+        return self.pos
+
+    def step(self, dt, substeps=1):
+        """Advance the coarse physics by `substeps` fixed steps of size dt"""
+        self.coarse.step(dt, substeps)
+        self._update()
+        return self.pos
+
+    def _update(self):
+        """Interpolate the coarse state onto the fine grid and refine it"""
+        fine, coarse = self.fine, self.coarse
+        with torch.no_grad(), fine._phase("upsample"):
+            pos = resample(coarse.pos, fine.height, fine.width, self.interpolation)
+            if self.refine:
+                pos = self._refine(pos)
+            # Velocity colouring reads pos - prev_pos, or velo for the velocity-based methods
+            fine.prev_pos = fine.pos
+            fine.pos = pos.contiguous()
+            if fine.method in ("euler", "implicit"):
+                fine.velo = resample(coarse.velo, fine.height, fine.width, self.interpolation).contiguous()
+            fine._apply_pins()
+
+    def _refine(self, pos):
+        """pos corrected by self.refine fine-level Jacobi sweeps of the spring forces"""
+        fine = self.fine
+        # Fine-level weight per unit stiffness, on the y component
+        sag = fine.gravity * fine.mass / fine.stiffness
+        weight = 2 / 3 / fine.neighbors * fine.free_mask
+        for _ in range(self.refine):
+            # Damped Jacobi (2/3) on stiffness * laplacian(pos) = mass * gravity
+            delta = fine._laplacian(pos)
+            delta[..., :1] -= sag
+            pos.addcmul_(delta, weight)
+        return pos
+
+    def render_into(self, pixels, color, mode="points", color_by=None, shifts=(16, 8, 0)):
+        return self.fine.render_into(pixels, color, mode=mode, color_by=color_by, shifts=shifts)
+
+    def render(self):
+        return self.fine.render()
+
+
+def compare(height, width, ratio, steps, dt=0.1, method="verlet", interpolation="bilinear", refine=0,
+            device="cpu", check_every=50):
+    """Step a full-resolution Cloth and an LODCloth side by side
+
+    Returns the step times of both (the LOD one including the upsampling) and the
+    RMS and max distance between them, in units of the spacing, every
+    check_every steps.
+    """
+    full = Cloth(height, width, 1.0, 30, 0.01, device=device, method=method)
+    lod = LODCloth(height, width, 1.0, 30, 0.01, ratio=ratio, interpolation=interpolation, refine=refine,
+                   device=device, method=method)
+    full_time = lod_time = 0.0
+    errors = []
+    for i in range(1, steps + 1):
+        t0 = time.perf_counter()
+        full.step(dt)
+        t1 = time.perf_counter()
+        lod.step(dt)
+        t2 = time.perf_counter()
+        full_time += t1 - t0
+        lod_time += t2 - t1
+        if i % check_every == 0 or i == steps:
+            distance = torch.linalg.vector_norm(lod.pos - full.pos, dim=-1)
+            errors.append({"step": i, "rms": distance.square().mean().sqrt().item(), "max": distance.max().item()})
+    return {
+        "full_ms": full_time / steps * 1e3,
+        "lod_ms": lod_time / steps * 1e3,
+        "coarse": (lod.coarse.height, lod.coarse.width),
+        "errors": errors,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Level-of-detail Cloth: speed and error against full resolution")
+    parser.add_argument("--size", default="256x512", help="HEIGHTxWIDTH of the rendered grid")
+    parser.add_argument("--ratios", nargs="+", type=int, default=[2, 4])
+    parser.add_argument("--refine", nargs="+", type=int, default=[0, 2], help="fine-level Jacobi sweeps per frame")
+    parser.add_argument("--interpolation", nargs="+", default=["bilinear"], help="bilinear and/or bicubic")
+    parser.add_argument("--method", default="verlet")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--dt", type=float, default=0.1)
+    args = parser.parse_args(argv)
+    height, width = (int(v) for v in args.size.lower().split("x"))
+
+    for ratio in args.ratios:
+        for interpolation in args.interpolation:
+            for refine in args.refine:
+                result = compare(height, width, ratio, args.steps, args.dt, args.method, interpolation, refine,
+                                 args.device)
+                errors = " ".join(f"{e['step']}:{e['rms']:.3f}/{e['max']:.3f}" for e in result["errors"])
+                print(f"{height}x{width} ratio={ratio} ({result['coarse'][0]}x{result['coarse'][1]}) {interpolation} "
+                      f"refine={refine}: {result['lod_ms']:.2f} ms/step vs {result['full_ms']:.2f} full, "
+                      f"rms/max error {errors}")
+
+
+if __name__ == "__main__":
+    main()
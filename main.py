@@ -1,7 +1,10 @@
+import argparse
 import pygame as pg
-import numpy as np
-from ui import UI, get_screen_resolution
-import time
+from ui import UI
+
+parser = argparse.ArgumentParser(description="Cloth Simulation")
+parser.add_argument("--replay", default=None, help="play back a recorded trajectory file")
+args = parser.parse_args()
 
 # pygame setup
 pg.init()
@@ -14,14 +17,15 @@ background = pg.Surface(screen.get_size())
 background = background.convert()
 background.fill((0, 0, 0))
 
-mainUI = UI(screen)
+mainUI = UI(screen, replay=args.replay)
+# The background is drawn once; after that the UI reports what it changed
+screen.blit(background, (0, 0))
+pg.display.flip()
 
 clock = pg.time.Clock()
 running = True
 dt = 0
 
-st = time.time()
-
 while running:
     # poll for events
     for event in pg.event.get():
@@ -38,19 +42,16 @@ while running:
                 pass
             if event.key == pg.K_u:
                 mainUI.toggle_parameters()
+            if event.key == pg.K_p:
+                mainUI.export_profile()
         mainUI.handle_event(event)
 
-    # fill the screen with a color to wipe away anything from last frame
-    screen.blit(background, (0, 0))
-
-    mainUI.update()
-    mainUI.draw()
-
-    pg.display.flip()
+    with mainUI.phase("frame"):
+        mainUI.update()
+        mainUI.draw()
 
-    tt = time.time()
-    print("FPS: ", 1 / (tt - st))
-    st = tt
+        # Push only the changed rectangles instead of flipping the whole window
+        pg.display.update(mainUI.take_dirty())
 
     # Limit framerate
     # clock.tick(100)
@@ -0,0 +1,112 @@
+import collections
+import contextlib
+import csv
+import json
+import threading
+import time
+
+import numpy as np
+import torch
+
+# Shared no-op context for disabled profiling
+NULL_PHASE = contextlib.nullcontext()
+
+
+class Profiler:
+    """Per-phase timers with rolling statistics and CSV/JSON/Chrome trace export
+
+    phase(name) times a block. Phases doing device work pass cuda=True and are
+    timed with CUDA events when CUDA is available; those are resolved lazily by
+    collect(), so profiling never forces a device sync. Everything else uses
+    perf_counter. The last `window` samples of each phase feed stats(); the
+    last `max_events` spans are kept for the trace.
+    """
+
+    def __init__(self, window=120, max_events=100000):
+        self.window = window
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.events = collections.deque(maxlen=max_events)
+        self.pending = collections.deque()
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.enabled = True
+
+    @contextlib.contextmanager
+    def _timed(self, name, cuda):
+        tid = threading.get_ident()
+        start = time.perf_counter()
+        if cuda:
+            begin, end = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
+            begin.record()
+            yield
+            end.record()
+            with self.lock:
+                self.pending.append((name, start, tid, begin, end))
+        else:
+            yield
+            self._add(name, start, (time.perf_counter() - start) * 1e3, tid)
+
+    def phase(self, name, cuda=False):
+        """Context manager timing one occurrence of phase `name`"""
+        if not self.enabled:
+            return NULL_PHASE
+        return self._timed(name, cuda and torch.cuda.is_available())
+
+    def _add(self, name, start, ms, tid):
+        with self.lock:
+            self.samples[name].append(ms)
+            self.events.append((name, (start - self.origin) * 1e6, ms * 1e3, tid))
+
+    def collect(self):
+        """Fold finished CUDA event timings into the statistics"""
+        while self.pending:
+            name, start, tid, begin, end = self.pending[0]
+            if not end.query():
+                break
+            self.pending.popleft()
+            self._add(name, start, begin.elapsed_time(end), tid)
+
+    def stats(self):
+        """{phase: {count, mean, p50, p90, max}} in milliseconds over the rolling window"""
+        self.collect()
+        with self.lock:
+            samples = {name: np.array(values) for name, values in self.samples.items() if values}
+        return {
+            name: {
+                "count": len(v),
+                "mean": float(v.mean()),
+                "p50": float(np.percentile(v, 50)),
+                "p90": float(np.percentile(v, 90)),
+                "max": float(v.max()),
+            }
+            for name, v in samples.items()
+        }
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.events.clear()
+            self.pending.clear()
+        self.origin = time.perf_counter()
+
+    def export_csv(self, path):
+        rows = self.stats()
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["phase", "count", "mean_ms", "p50_ms", "p90_ms", "max_ms"])
+            for name, s in rows.items():
+                writer.writerow([name, s["count"], s["mean"], s["p50"], s["p90"], s["max"]])
+
+    def export_json(self, path):
+        with open(path, "w") as f:
+            json.dump({"window": self.window, "phases": self.stats()}, f, indent=2)
+
+    def export_chrome_trace(self, path):
+        """Write the recorded spans in Chrome trace format (chrome://tracing, Perfetto)"""
+        self.collect()
+        with self.lock:
+            events = list(self.events)
+        trace = [{"name": name, "ph": "X", "ts": ts, "dur": dur, "pid": 0, "tid": tid}
+                 for name, ts, dur, tid in events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
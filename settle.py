@@ -0,0 +1,113 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import torch
+
+from Cloth import Cloth
+
+
+# Methods the cache settles: their motion dies out under the energy limiter. implicit
+# keeps swinging; pbd settles through its damping, but at the cache's dt takes about a
+# minute at the UI's grid size (`python settle.py --method pbd --dt 1` checks it)
+SETTLE_METHODS = ("verlet", "euler")
+
+
+def settle(cloth, dt=0.2, max_steps=20000, tol=0.1, check_every=200):
+    """Step the cloth until no particle moves faster than tol spacings per unit time, or max_steps
+
+    Returns (steps taken, converged). The speed is the largest displacement over
+    one step, read back every check_every steps.
+    """
+    taken = 0
+    while taken < max_steps:
+        n = min(check_every, max_steps - taken)
+        cloth.step(dt, n - 1)
+        before = cloth.pos.clone()
+        cloth.step(dt)
+        taken += n
+        speed = torch.linalg.vector_norm(cloth.pos - before, dim=-1).max() / dt
+        if speed.item() <= tol * cloth.spacing:
+            return taken, True
+    return taken, False
+
+
+class SettledCache:
+    """On-disk cache of settled cloth states keyed by grid size and parameters
+
+    States are saved with Cloth.save_state on the CPU, so a cloth on any device,
+    in any process, can start from one. The first request for a configuration
+    settles the cloth with settle() and stores the result if it converged.
+    """
+
+    def __init__(self, directory=None, dt=0.2, max_steps=20000, tol=0.1):
+        self.directory = directory or os.path.join(os.path.expanduser("~"), ".cache", "cloth", "settled")
+        self.settings = {"dt": dt, "max_steps": max_steps, "tol": tol}
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, cloth):
+        """Cache file for the cloth's configuration, colliders and the settle settings"""
+        colliders = [[type(c).__name__, vars(c)] for c in cloth.colliders]
+        key = json.dumps({"config": cloth.config(), "colliders": colliders, "settle": self.settings},
+                         sort_keys=True, default=repr)
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest()[:16] + ".pt")
+
+    def load(self, cloth):
+        """Load the settled state into the fresh cloth, settling and storing it on a miss
+
+        Returns True on a cache hit. A cloth that has not settled after max_steps
+        is left where it got to and nothing is stored.
+        """
+        if cloth.method not in SETTLE_METHODS:
+            raise ValueError(f"{cloth.method} cloths never settle; use one of {', '.join(SETTLE_METHODS)}")
+        path = self.path(cloth)
+        if os.path.exists(path):
+            cloth.load_state(path)
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        _, converged = settle(cloth, **self.settings)
+        if not converged:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        # Write then rename, so other processes never read a partial file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        cloth.save_state(tmp)
+        os.replace(tmp, path)
+        return False
+
+    def clear(self):
+        """Remove every cached state"""
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".pt"):
+                    os.remove(os.path.join(self.directory, name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that a cloth settles with the default parameters")
+    parser.add_argument("--size", default="80x160", help="HEIGHTxWIDTH")
+    parser.add_argument("--method", default="verlet")
+    parser.add_argument("--dt", type=float, default=0.2)
+    parser.add_argument("--max-steps", type=int, default=20000)
+    parser.add_argument("--tol", type=float, default=0.1, help="settled below this speed, in spacings per unit time")
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args(argv)
+    height, width = (int(v) for v in args.size.lower().split("x"))
+
+    cloth = Cloth(height, width, 1.0, 30, 0.01, device=args.device, method=args.method,
+                  preallocate=args.method in ("verlet", "euler"))
+    start = time.perf_counter()
+    steps, converged = settle(cloth, args.dt, args.max_steps, args.tol)
+    print(f"{height}x{width} {args.method} dt={args.dt}: {'settled' if converged else 'not settled'} after {steps} steps "
+          f"({time.perf_counter() - start:.1f} s), lowest point y={cloth.pos[..., 0].min().item():.1f}")
+    return 0 if converged else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
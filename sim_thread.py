@@ -0,0 +1,106 @@
+import queue
+import threading
+
+import torch
+
+
+class TripleBuffer:
+    """Latest-frame handoff between one producer thread and one consumer thread
+
+    The producer always owns a back buffer to draw into and the consumer always
+    owns a front buffer to read from, so neither ever waits for the other; frames
+    the consumer was too slow to pick up are simply overwritten.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buffers = [None, None, None]
+        self.back, self.ready, self.front = 0, 1, 2
+        self.fresh = False
+
+    def back_buffer(self, shape, dtype=torch.int32, pin_memory=False):
+        """Producer side: the buffer to draw the next frame into"""
+        buf = self.buffers[self.back]
+        if buf is None or tuple(buf.shape) != tuple(shape):
+            buf = torch.zeros(shape, dtype=dtype, pin_memory=pin_memory)
+            self.buffers[self.back] = buf
+        return buf
+
+    def publish(self):
+        """Producer side: hand the back buffer over as the newest frame"""
+        with self.lock:
+            self.back, self.ready = self.ready, self.back
+            self.fresh = True
+
+    def latest(self):
+        """Consumer side: the newest frame, or None if nothing new was published"""
+        with self.lock:
+            if not self.fresh:
+                return None
+            self.front, self.ready = self.ready, self.front
+            self.fresh = False
+        return self.buffers[self.front]
+
+
+class SimulationThread(threading.Thread):
+    """Steps and rasterizes a Cloth in the background, publishing frames to a TripleBuffer
+
+    Render settings (frame_size, color, mode, color_by, shifts) and substeps are
+    plain attributes the UI thread may change at any time; they are read once per
+    frame. While the thread runs it is the only one allowed to touch the cloth;
+    other threads change it through submit(), which runs the change here between
+    ticks.
+    """
+
+    def __init__(self, cloth, substeps=1):
+        super().__init__(daemon=True)
+        self.cloth = cloth
+        self.substeps = substeps
+        self.frames = TripleBuffer()
+
+        self.frame_size = None
+        self.color = 0
+        self.mode = "points"
+        self.color_by = None
+        self.shifts = (16, 8, 0)
+
+        self.edits = queue.Queue()
+        self.running = threading.Event()
+        self.stopped = threading.Event()
+        self.frames_published = 0
+
+    def run(self):
+        pin_memory = self.cloth.pos.device.type == "cuda"
+        while not self.stopped.is_set():
+            self._apply_edits()
+            if not self.running.wait(0.05):
+                continue
+            self.cloth.tick(self.substeps)
+
+            size = self.frame_size
+            if size is None:
+                continue
+            frame = self.frames.back_buffer(size, pin_memory=pin_memory)
+            self.cloth.render_into(frame, self.color, mode=self.mode, color_by=self.color_by, shifts=self.shifts)
+            self.frames.publish()
+            self.frames_published += 1
+        # Edits submitted while stopping still reach the cloth
+        self._apply_edits()
+
+    def submit(self, edit):
+        """Queue edit(cloth) to run on this thread before its next tick, paused or not"""
+        self.edits.put(edit)
+
+    def _apply_edits(self):
+        while True:
+            try:
+                edit = self.edits.get_nowait()
+            except queue.Empty:
+                return
+            edit(self.cloth)
+
+    def stop(self):
+        """Stop and wait for the worker, after which the cloth may be used again"""
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
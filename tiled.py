@@ -0,0 +1,228 @@
+import argparse
+import time
+
+import torch
+import torch.multiprocessing as mp
+
+from Cloth import Cloth
+
+
+def _worker(rank, bounds, bufs, velo, neighbors, inv_mass, params, partials, energy, cmd, go, sync, done):
+    """Step rows bounds[rank] of the shared grid in lockstep with the other workers"""
+    torch.set_num_threads(1)
+    height, width = bufs[0].shape[:2]
+    r0, r1 = bounds[rank]
+    rows = r1 - r0
+    # Rows of the grid copied into the padded band: the band itself plus one halo
+    # row above and below; halo rows outside the grid stay zero like Cloth.padded
+    lo, hi = max(r0 - 1, 0), min(r1 + 1, height)
+
+    # Scratch in the cloth's dtype; the energies are partials' (accumulation) dtype
+    dtype = bufs[0].dtype
+    padded = torch.zeros(rows + 2, width + 2, 2, dtype=dtype)
+    force = torch.empty(rows, width, 2, dtype=dtype)
+    delta = torch.empty(rows, width, 2, dtype=dtype)
+    vel = torch.empty(rows, width, 1, dtype=dtype)
+    vel_norm = torch.empty(rows, width, 1, dtype=dtype)
+    neighbors = neighbors[r0:r1]
+    inv_mass = inv_mass[r0:r1]
+    mass, gravity, stiffness, alpha, decay, dirs, method, eps = params
+    pp = 0.8 if method == "verlet" else 1
+
+    while True:
+        go.wait()
+        steps, dt, slot, stop = int(cmd[0]), float(cmd[1]), int(cmd[2]), bool(cmd[3])
+        if stop:
+            return
+        energy_l = energy[1].clone()
+        for s in range(slot, slot + steps):
+            pos, prev, new = bufs[s % 3], bufs[(s - 1) % 3], bufs[(s + 1) % 3]
+            band = pos[r0:r1]
+
+            # Same padded-Laplacian stencil as Cloth._spring_force, on this band
+            padded[lo - r0 + 1:hi - r0 + 1, 1:-1] = pos[lo:hi]
+            views = [padded[1 + ii:1 + ii + rows, 1 + jj:1 + jj + width] for ii, jj in dirs]
+            torch.add(views[0], views[1], out=force)
+            for v in views[2:]:
+                force += v
+            force.addcmul_(neighbors, band, value=-1)
+            force *= stiffness
+            force[..., :1] -= gravity * mass
+            force *= inv_mass
+
+            if method == "verlet":
+                torch.sub(band, prev[r0:r1], out=delta)
+                delta.add_(force.mul_(dt ** 2 / mass))
+            elif method == "euler":
+                torch.mul(velo[r0:r1], dt, out=delta)
+                velo[r0:r1].add_(force.mul_(dt / mass))
+
+            torch.linalg.vector_norm(delta, dim=-1, keepdim=True, out=vel)
+            partials[rank] = torch.sum(torch.square(vel, out=vel_norm), dtype=partials.dtype)
+            sync.wait()
+
+            # Every worker reduces the partial energies in the same order, so they all
+            # agree on the limiter state without another exchange
+            total = partials.sum()
+            energy_n = torch.minimum(total, energy_l) * decay
+            energy_n = energy_n * pp + total * (1 - pp)
+            scale = energy_n / (total + 1e-6)
+            energy_l = energy_l.lerp(energy_n, alpha)
+
+            torch.div(delta, torch.clamp_min(vel, eps, out=vel_norm), out=force)
+            vel.mul_(scale)
+            torch.addcmul(band, force, vel, out=new[r0:r1])
+            sync.wait()
+
+        if rank == 0 and steps:
+            energy[0] = total
+            energy[1] = energy_l
+        done.wait()
+
+
+def _check_unsupported(cloth):
+    """Raise ValueError for cloth features the workers do not implement"""
+    if cloth.colliders or cloth.self_collision is not None:
+        raise ValueError("TiledCloth does not run colliders or self-collision")
+    if cloth.diagnostics is not None:
+        raise ValueError("TiledCloth does not fill the diagnostics ring; build the cloth with diag_size=0")
+    if cloth.recorder is not None:
+        raise ValueError("TiledCloth does not feed a trajectory recorder")
+
+
+class TiledCloth:
+    """Steps a CPU Cloth with one worker process per horizontal band of rows
+
+    The positions live in shared memory, so the one-row halos a band needs from
+    its neighbours for the springs in cloth.dir are read straight from the shared
+    grid after a barrier. The global energy limiter is reduced from per-band
+    partial sums. cloth.pos/prev_pos/velo/energy_l are updated in place after every
+    step() call; the parameters and pins are read once, at construction, and the
+    pins must not change afterwards. Collisions, the diagnostics ring and a
+    trajectory recorder are not run by the workers, so such cloths are refused.
+    """
+
+    def __init__(self, cloth, workers=None):
+        if cloth.batch is not None or cloth.pos.device.type != "cpu":
+            raise ValueError("TiledCloth needs an unbatched CPU cloth")
+        if cloth.method not in ("verlet", "euler"):
+            raise ValueError("TiledCloth supports the verlet and euler methods")
+        if max(max(abs(ii), abs(jj)) for ii, jj in cloth.dir) > 1:
+            raise ValueError("TiledCloth supports neighbour offsets of at most one row")
+        _check_unsupported(cloth)
+        self.cloth = cloth
+        # Pins as the workers see them, to catch pin/unpin/move_pins after construction
+        self.pinned = cloth.pinned.clone()
+        self.pin_pos = cloth.pin_pos.clone()
+        workers = workers or mp.cpu_count()
+        workers = max(1, min(workers, cloth.height))
+        self.workers = workers
+        edges = [round(i * cloth.height / workers) for i in range(workers + 1)]
+        bounds = list(zip(edges[:-1], edges[1:]))
+
+        # Three position buffers rotate through the pos/prev_pos/new roles
+        prev_pos = torch.empty_like(cloth.pos) if cloth.prev_pos is None else cloth.prev_pos.contiguous()
+        self.bufs = [cloth.pos.contiguous().share_memory_(), torch.empty_like(cloth.pos).share_memory_(),
+                     prev_pos.share_memory_()]
+        self.slot = 0
+        # verlet keeps no velocities
+        self.velo = None if cloth.velo is None else cloth.velo.contiguous().share_memory_()
+        self.energy = torch.stack([cloth.energy, cloth.energy_l]).share_memory_()
+        self.partials = torch.zeros(workers, dtype=cloth.accum_dtype).share_memory_()
+        # steps, dt, slot, stop
+        self.cmd = torch.zeros(4, dtype=torch.float64).share_memory_()
+
+        ctx = mp.get_context("spawn")
+        self.go = ctx.Barrier(workers + 1)
+        self.done = ctx.Barrier(workers + 1)
+        # Kept on self: the semaphores must outlive the workers' start-up
+        self.sync = ctx.Barrier(workers)
+        params = (cloth.mass, cloth.gravity, cloth.stiffness, cloth.alpha, cloth.decay, list(cloth.dir), cloth.method,
+                  cloth.eps)
+        self.procs = [
+            ctx.Process(target=_worker, daemon=True,
+                        args=(rank, bounds, self.bufs, self.velo, cloth.neighbors, cloth.inv_mass,
+                              params, self.partials, self.energy, self.cmd, self.go, self.sync, self.done))
+            for rank in range(workers)
+        ]
+        for p in self.procs:
+            p.start()
+        self._publish()
+
+    def _publish(self):
+        self.cloth.pos = self.bufs[self.slot % 3]
+        self.cloth.prev_pos = self.bufs[(self.slot - 1) % 3]
+        if self.velo is not None:
+            self.cloth.velo = self.velo
+        self.cloth.energy = self.energy[0].clone()
+        self.cloth.energy_l = self.energy[1].clone()
+
+    def step(self, dt, substeps=1):
+        """Advance the physics by `substeps` fixed steps of size dt on all workers"""
+        _check_unsupported(self.cloth)
+        if not (torch.equal(self.pinned, self.cloth.pinned) and torch.equal(self.pin_pos, self.cloth.pin_pos)):
+            raise RuntimeError("the pins changed after TiledCloth was built; the workers only know the old ones")
+        self.energy[1] = self.cloth.energy_l
+        self.cmd[:] = torch.tensor([substeps, dt, self.slot % 3, 0], dtype=torch.float64)
+        self.go.wait()
+        self.done.wait()
+        self.slot += substeps
+        self.cloth.steps += substeps
+        self._publish()
+        return self.cloth.pos
+
+    def close(self):
+        """Stop the worker processes"""
+        if self.procs:
+            self.cmd[3] = 1
+            self.go.wait()
+            for p in self.procs:
+                p.join()
+            self.procs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def check(height, width, workers, steps, dt=0.1, method="verlet", dtype="float32"):
+    """Max absolute position difference between tiled and single-process stepping"""
+    single = Cloth(height, width, 1.0, 30, 0.01, device="cpu", method=method, preallocate=True, dtype=dtype)
+    tiled = Cloth(height, width, 1.0, 30, 0.01, device="cpu", method=method, dtype=dtype)
+    with TiledCloth(tiled, workers) as runner:
+        for _ in range(steps):
+            single.step(dt)
+            runner.step(dt)
+        return (single.pos - tiled.pos).abs().max().item()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-process tiled Cloth stepping")
+    parser.add_argument("--size", default="4096x4096", help="HEIGHTxWIDTH")
+    parser.add_argument("--workers", type=int, default=None, help="default: one per core")
+    parser.add_argument("--method", default="verlet")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--dt", type=float, default=0.1)
+    parser.add_argument("--dtype", default="float32", help="float32 or float64")
+    parser.add_argument("--check", action="store_true", help="compare against single-process stepping")
+    args = parser.parse_args(argv)
+    height, width = (int(v) for v in args.size.lower().split("x"))
+
+    if args.check:
+        diff = check(height, width, args.workers, args.steps, args.dt, args.method, args.dtype)
+        print(f"max |tiled - single| after {args.steps} steps: {diff:.3g}")
+        return
+
+    cloth = Cloth(height, width, 1.0, 30, 0.01, device="cpu", method=args.method, dtype=args.dtype)
+    with TiledCloth(cloth, args.workers) as runner:
+        runner.step(args.dt)
+        start = time.perf_counter()
+        runner.step(args.dt, args.steps)
+        elapsed = time.perf_counter() - start
+    print(f"{height}x{width} {args.method} workers={runner.workers}: {args.steps / elapsed:.2f} steps/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+import torch
+
+from Cloth import Cloth
+
+MAGIC = b"CLOTHTRJ"
+# Fixed-size header: MAGIC followed by space-padded JSON, then raw frames
+HEADER_SIZE = 4096
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    if not raw.startswith(MAGIC):
+        raise ValueError(f"{path} is not a cloth trajectory")
+    return json.loads(raw[len(MAGIC):])
+
+
+class TrajectoryRecorder:
+    """Streams cloth.pos to an append-only file every `every` steps
+
+    The current state is written as frame 0 and frame k holds step
+    start_step + k * every, so a reader can seek without an index. Positions
+    are copied into one of `buffers` preallocated host buffers (pinned for CUDA,
+    so the copy is asynchronous) and written out by a background thread; the
+    step loop only waits when all buffers are still queued for writing.
+    """
+
+    def __init__(self, path, cloth, every=1, buffers=4):
+        self.cloth = cloth
+        self.every = every
+        self.start_step = cloth.steps
+        # NumPy, which reads the frames back, has no bfloat16
+        dtype = torch.float32 if cloth.pos.dtype == torch.bfloat16 else cloth.pos.dtype
+        header = {
+            "shape": list(cloth.pos.shape),
+            "dtype": str(dtype).replace("torch.", ""),
+            "every": every,
+            "start_step": cloth.steps,
+            "params": cloth.config(),
+        }
+        text = MAGIC + json.dumps(header).encode()
+        if len(text) > HEADER_SIZE:
+            raise ValueError("trajectory header too large")
+        self.file = open(path, "wb")
+        self.file.write(text.ljust(HEADER_SIZE, b" "))
+
+        pin_memory = cloth.pos.device.type == "cuda"
+        self.free = queue.Queue()
+        for _ in range(buffers):
+            self.free.put(torch.empty(cloth.pos.shape, dtype=dtype, pin_memory=pin_memory))
+        self.pending = queue.Queue()
+        self.frames_written = 0
+        # Captures that had to wait for the writer to free a buffer
+        self.stalls = 0
+        self.writer = threading.Thread(target=self._write, daemon=True)
+        self.writer.start()
+
+        self.capture(force=True)
+        cloth.recorder = self
+
+    def capture(self, force=False):
+        """Queue the cloth's current positions if this step is due; called by Cloth.step"""
+        if not force and (self.cloth.steps - self.start_step) % self.every:
+            return
+        try:
+            buf = self.free.get_nowait()
+        except queue.Empty:
+            self.stalls += 1
+            buf = self.free.get()
+        buf.copy_(self.cloth.pos, non_blocking=True)
+        event = None
+        if self.cloth.pos.device.type == "cuda":
+            event = torch.cuda.Event()
+            event.record()
+        self.pending.put((buf, event))
+
+    def _write(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            buf, event = item
+            if event is not None:
+                event.synchronize()
+            self.file.write(buf.numpy().data)
+            self.frames_written += 1
+            self.free.put(buf)
+        self.file.flush()
+
+    def close(self):
+        """Write out the queued frames and detach from the cloth"""
+        if self.writer is None:
+            return
+        if self.cloth.recorder is self:
+            self.cloth.recorder = None
+        self.pending.put(None)
+        self.writer.join()
+        self.writer = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryReplay:
+    """Plays a recorded trajectory back through the same tick/render_into calls as a Cloth
+
+    Frames are read zero-copy from a memory map of the file; frame(k) and seek()
+    are O(1). The file may still be growing: refresh() maps any frames appended
+    since. Rendering goes through a CPU Cloth built from the header parameters
+    whose positions are pointed at the current frame.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        header = read_header(path)
+        self.shape = tuple(header["shape"])
+        self.dtype = np.dtype(header["dtype"])
+        self.every = header["every"]
+        self.start_step = header["start_step"]
+        self.params = header["params"]
+        self.frames = None
+        self.refresh()
+
+        # The frames' dtype, which differs from the recorded cloth's for bfloat16
+        self.cloth = Cloth(device="cpu", **dict(self.params, dtype=header["dtype"]))
+        self.index = -1
+        self.seek(self.start_step)
+
+    def refresh(self):
+        """Map the complete frames currently in the file; returns the frame count"""
+        frame_bytes = self.dtype.itemsize * int(np.prod(self.shape))
+        count = (os.path.getsize(self.path) - HEADER_SIZE) // frame_bytes
+        if self.frames is None or len(self.frames) != count:
+            # Copy-on-write mapping: readable as writable tensors, the file is never modified
+            self.frames = np.memmap(self.path, dtype=self.dtype, mode="c", offset=HEADER_SIZE,
+                                    shape=(count, *self.shape)) if count else np.empty((0, *self.shape), self.dtype)
+        return count
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame(self, index):
+        """Positions of recorded frame `index` as a tensor viewing the file"""
+        return torch.from_numpy(self.frames[index])
+
+    @property
+    def pos(self):
+        return self.cloth.pos
+
+    @property
+    def steps(self):
+        """Simulation step of the current frame"""
+        return self.start_step + self.index * self.every
+
+    def seek(self, step):
+        """Jump to the last frame recorded at or before `step`"""
+        index = (step - self.start_step) // self.every
+        self._show(min(max(index, 0), len(self) - 1))
+
+    def _show(self, index):
+        if index == self.index or index < 0:
+            return
+        self.index = index
+        self.cloth.pos = self.frame(index)
+        # Velocity colouring reads pos - prev_pos, or velo for the velocity-based methods
+        self.cloth.prev_pos = self.frame(max(index - 1, 0))
+        self.cloth.velo = (self.cloth.pos - self.cloth.prev_pos) / self.every
+
+    def tick(self, substeps=1):
+        """Advance playback by `substeps` frames, holding the last one"""
+        if self.index + substeps >= len(self):
+            self.refresh()
+        self._show(min(self.index + substeps, len(self) - 1))
+        return self.cloth.pos
+
+    def render_into(self, pixels, color, mode="points", color_by=None, shifts=(16, 8, 0)):
+        return self.cloth.render_into(pixels, color, mode=mode, color_by=color_by, shifts=shifts)
+
+    def render(self):
+        return self.cloth.render()
@@ -2,6 +2,10 @@ import pygame as pg
 import numpy as np
 import pygame.surfarray as arraysurf
 from Cloth import Cloth
+from sim_thread import SimulationThread
+from trajectory import TrajectoryReplay
+from settle import SETTLE_METHODS, SettledCache
+from profiler import Profiler, NULL_PHASE
 import torch
 
 def get_screen_resolution():
@@ -10,10 +14,13 @@ def get_screen_resolution():
     return info.current_w, info.current_h
 
 class UI:
-    def __init__(self, screen):
+    def __init__(self, screen, replay=None):
         self.screen = screen
+        # Path of a recorded trajectory to play back instead of simulating
+        self.replay = replay
         self.font = pg.font.Font(None, 36)
         self.small_font = pg.font.Font(None, 28)
+        self.profile_font = pg.font.Font(None, 22)
         self.buttons = []
         self.selected_button = None
         self.show_parameters = False
@@ -27,9 +34,28 @@ class UI:
             'alpha': 0.003,
             'decay': 0.99997,
             'init_energy': 1000,
+            'substeps': 1,
+            'iterations': 20,
             'method': 'Verlet',
-            'device': 'cuda' if torch.cuda.is_available() else 'cpu',
+            # 'auto' is resolved when the cloth is built, so CUDA is not touched at startup
+            'device': 'auto',
+            'backend': 'Eager',
+            'render': 'Points',
+            'threaded': False,
+            'settled': False,
+            'profile': False,
         }
+        # Parameters edited through a dropdown, with their options
+        self.dropdown_options = {
+            'method': ['Euler', 'Verlet', 'PBD', 'Implicit'],
+            'device': ['auto', 'cuda', 'cpu'],
+            'backend': ['Eager', 'Compile', 'NumPy'],
+            'render': ['Points', 'Mesh', 'Strain', 'Velocity'],
+        }
+        # Parameters applied to the running cloth as soon as they are edited; the
+        # others take effect on the next Run/Reset
+        self.live_parameters = ('height', 'width', 'spacing', 'mass', 'gravity', 'stiffness', 'alpha',
+                                'decay', 'iterations', 'method', 'device', 'backend')
         self.dropdown_open = False  # Add this line
         self.editing_parameter = None  # Track which parameter is being edited
         self.edit_text = ""  # Store text while editing
@@ -79,6 +105,33 @@ class UI:
 
         self.cloth = None
         self.running = False
+        # Cloth frames are rasterized straight into this surface (plus a 1px border)
+        self.frame_surface = None
+        # Screen area the last cloth frame was blitted to
+        self.frame_area = None
+        # Toolbar and parameter panel are drawn into cached surfaces, redrawn only
+        # when their key (everything they show) changes; only changed rectangles
+        # are collected in self.dirty for pg.display.update
+        self.toolbar_key = None
+        self.toolbar_cache = None
+        self.panel_key = None
+        self.panel_cache = None
+        self.panel_shown = False
+        self.overlays = []
+        self.dirty = []
+        # Background stepping/rendering worker, used when 'threaded' is checked
+        self.worker = None
+        # With 'settled' checked, runs start from a cached equilibrium state
+        self.settled_cache = SettledCache()
+        # Per-phase timings, collected and shown as an overlay while 'profile' is checked
+        self.profiler = Profiler()
+        # Particles held by the mouse: (cloth, mask, offsets from the cursor in cloth units).
+        # Only read and written by the edits of edit_cloth, which may run on the worker
+        self.grabbed = None
+        # Left button went down in the display area and is still held
+        self.dragging = False
+        # Particles within this many pixels of a click are grabbed
+        self.grab_radius = 15
 
     def _create_icons(self):
         """Create simple geometric icons using pygame"""
@@ -130,30 +183,136 @@ class UI:
             'text': text,
             'color': color,
             'surface': self.font.render(text, True, (255, 255, 255)),
+            'tooltip': self.small_font.render(text, True, (255, 255, 255)),
             'hover': False,
             'icon': icon
         }
         self.buttons.append(button)
 
+    def phase(self, name):
+        """Profiler phase context while profiling is enabled, otherwise a no-op"""
+        if not self.parameters['profile']:
+            return NULL_PHASE
+        return self.profiler.phase(name)
+
     def draw(self):
-        # Draw toolbar background
-        toolbar_rect = pg.Rect(0, 0, self.screen.get_width(), self.toolbar_height)
-        pg.draw.rect(self.screen, (40, 40, 40), toolbar_rect)
-        pg.draw.line(self.screen, (100, 100, 100), (0, self.toolbar_height), 
-                    (self.screen.get_width(), self.toolbar_height), 2)
+        """Draw the toolbar, parameter panel and overlays; see take_dirty() for what changed"""
+        with self.phase("ui draw"):
+            self._draw()
+        if self.parameters['profile']:
+            self.draw_profile()
+
+    def take_dirty(self):
+        """Screen rectangles changed since the last call, for pg.display.update"""
+        dirty, self.dirty = self.dirty, []
+        return dirty
+
+    def _repair(self, rect):
+        """Restore the background (or the last cloth frame) under an overlay"""
+        self.screen.fill((0, 0, 0), rect)
+        if self.frame_surface is not None and self.frame_area is not None:
+            area = rect.clip(self.frame_area)
+            if area:
+                # frame_surface has a 1px border around the display area
+                src = area.move(1 - self.frame_area.x, 1 - self.frame_area.y)
+                self.screen.blit(self.frame_surface, area, src)
+        self.dirty.append(rect)
+
+    def draw_profile(self):
+        """Overlay the rolling per-phase timings in the top-left of the display area"""
+        stats = self.profiler.stats()
+        rows = [("phase (ms)", "mean", "p90", "max")]
+        for name, s in sorted(stats.items(), key=lambda item: -item[1]['mean']):
+            rows.append((name, f"{s['mean']:.2f}", f"{s['p90']:.2f}", f"{s['max']:.2f}"))
+        if 'frame' in stats:
+            rows.append(("FPS", f"{1e3 / stats['frame']['mean']:.1f}", "", ""))
+        columns = (10, 110, 170, 230)
+        y = self.toolbar_height + 10
+        rect = pg.Rect(0, y - 5, 290, len(rows) * 18 + 10)
+        pg.draw.rect(self.screen, (0, 0, 0), rect)
+        for row in rows:
+            for x, cell in zip(columns, row):
+                self.screen.blit(self.profile_font.render(cell, True, (255, 255, 0)), (x, y))
+            y += 18
+        self.overlays.append(rect)
+        self.dirty.append(rect)
+
+    def export_profile(self, prefix="profile"):
+        """Write the profile as <prefix>.csv, <prefix>.json and <prefix>.trace.json"""
+        self.profiler.export_csv(prefix + ".csv")
+        self.profiler.export_json(prefix + ".json")
+        self.profiler.export_chrome_trace(prefix + ".trace.json")
+
+    def _draw(self):
+        # Overlays from the last frame (tooltips, profile) are drawn over the display area
+        for rect in self.overlays:
+            self._repair(rect)
+        self.overlays = []
+
+        width, height = self.screen.get_size()
+        toolbar_key = (width, tuple(button['hover'] for button in self.buttons))
+        toolbar_changed = toolbar_key != self.toolbar_key
+        if toolbar_changed:
+            self.toolbar_key = toolbar_key
+            self.toolbar_cache = pg.Surface((width, self.toolbar_height + 2))
+            self._render_toolbar(self.toolbar_cache)
+            self.screen.blit(self.toolbar_cache, (0, 0))
+            self.dirty.append(self.toolbar_cache.get_rect())
+
+        panel_rect = pg.Rect(width - 300, 0, 300, height)
+        if self.show_parameters:
+            panel_key = self._panel_key()
+            panel_changed = panel_key != self.panel_key
+            if panel_changed:
+                self.panel_key = panel_key
+                self.panel_cache = pg.Surface(panel_rect.size)
+                self._render_panel(self.panel_cache)
+            # The panel covers the right end of the toolbar
+            if panel_changed or toolbar_changed or not self.panel_shown:
+                self.screen.blit(self.panel_cache, panel_rect)
+                self.dirty.append(panel_rect)
+        elif self.panel_shown:
+            # Uncover the toolbar and clear the rest until the next cloth frame
+            self._repair(panel_rect.clip(pg.Rect(0, self.toolbar_height + 2, width, height)))
+            self.screen.blit(self.toolbar_cache, (0, 0))
+            self.dirty.append(self.toolbar_cache.get_rect())
+        self.panel_shown = self.show_parameters
 
-        # Draw buttons
         for button in self.buttons:
-            # Draw button background
             if button['hover']:
-                pg.draw.rect(self.screen, (60, 60, 60), button['rect'])
-                # Draw tooltip
-                tooltip = self.small_font.render(button['text'], True, (255, 255, 255))
-                tooltip_rect = tooltip.get_rect(midtop=(
+                tooltip_rect = button['tooltip'].get_rect(midtop=(
                     button['rect'][0] + button['rect'][2]/2,
                     button['rect'][1] + button['rect'][3] + 5
                 ))
-                self.screen.blit(tooltip, tooltip_rect)
+                self.screen.blit(button['tooltip'], tooltip_rect)
+                self.overlays.append(tooltip_rect)
+                self.dirty.append(tooltip_rect)
+
+    def _panel_key(self):
+        """Everything the parameter panel shows; the cached panel is redrawn when it changes"""
+        hovered = None
+        if self.dropdown_open and self.editing_parameter in self.dropdown_options:
+            param_index = list(self.parameters.keys()).index(self.editing_parameter)
+            mx, my = pg.mouse.get_pos()
+            mx -= self.screen.get_width() - 300
+            top = 80 + param_index * 40 + 25
+            if 200 <= mx < 300 and my >= top:
+                hovered = (my - top) // 25
+        return (self.screen.get_height(), tuple(self.parameters.items()), self.editing_parameter,
+                self.edit_text, self.dropdown_open, hovered)
+
+    def _render_toolbar(self, surface):
+        # Draw toolbar background
+        toolbar_rect = pg.Rect(0, 0, surface.get_width(), self.toolbar_height)
+        pg.draw.rect(surface, (40, 40, 40), toolbar_rect)
+        pg.draw.line(surface, (100, 100, 100), (0, self.toolbar_height), 
+                    (surface.get_width(), self.toolbar_height), 2)
+
+        # Draw buttons
+        for button in self.buttons:
+            # Draw button background
+            if button['hover']:
+                pg.draw.rect(surface, (60, 60, 60), button['rect'])
             
             # Draw button icon
             if button['icon']:
@@ -161,79 +320,80 @@ class UI:
                     button['rect'][0] + button['rect'][2]/2,
                     button['rect'][1] + button['rect'][3]/2
                 ))
-                self.screen.blit(button['icon'], icon_rect)
+                surface.blit(button['icon'], icon_rect)
 
-        # Draw parameter panel if enabled
-        if self.show_parameters:
-            panel_rect = pg.Rect(self.screen.get_width() - 300, 0, 300, self.screen.get_height())
-            pg.draw.rect(self.screen, (20, 20, 20), panel_rect)
-            pg.draw.line(self.screen, (100, 100, 100), (panel_rect.x, 0), (panel_rect.x, panel_rect.height), 2)
+    def _render_panel(self, surface):
+        """Draw the parameter panel in panel-local coordinates"""
+        panel_rect = surface.get_rect()
+        pg.draw.rect(surface, (20, 20, 20), panel_rect)
+        pg.draw.line(surface, (100, 100, 100), (panel_rect.x, 0), (panel_rect.x, panel_rect.height), 2)
 
-            # Draw "Parameters" title
-            title = self.font.render("Parameters", True, (255, 255, 255))
-            self.screen.blit(title, (panel_rect.x + 20, 20))
+        # Draw "Parameters" title
+        title = self.font.render("Parameters", True, (255, 255, 255))
+        surface.blit(title, (panel_rect.x + 20, 20))
+        
+        y_offset = 80
+        dropdownList = []
+        for param, value in self.parameters.items():
+            # Parameter name
+            param_surface = self.small_font.render(param + ":", True, (200, 200, 200))
+            surface.blit(param_surface, (panel_rect.x + 20, y_offset))
             
-            y_offset = 80
-            dropdownList = []
-            for param, value in self.parameters.items():
-                # Parameter name
-                param_surface = self.small_font.render(param + ":", True, (200, 200, 200))
-                self.screen.blit(param_surface, (panel_rect.x + 20, y_offset))
-                
-                # Parameter value/checkbox
-                if isinstance(value, bool):
-                    checkbox_rect = pg.Rect(panel_rect.x + 200, y_offset, 20, 20)
-                    pg.draw.rect(self.screen, (255, 140, 0) if value else (50, 50, 50), checkbox_rect)
-                    pg.draw.rect(self.screen, (200, 200, 200), checkbox_rect, 2)
+            # Parameter value/checkbox
+            if isinstance(value, bool):
+                checkbox_rect = pg.Rect(panel_rect.x + 200, y_offset, 20, 20)
+                pg.draw.rect(surface, (255, 140, 0) if value else (50, 50, 50), checkbox_rect)
+                pg.draw.rect(surface, (200, 200, 200), checkbox_rect, 2)
+            else:
+                if param in self.dropdown_options:
+                    value_rect = pg.Rect(panel_rect.x + 200, y_offset, 100, 25)
+                    # Draw main box
+                    pg.draw.rect(surface, (40, 40, 40), value_rect)
+                    pg.draw.rect(surface, (200, 200, 200), value_rect, 2)
+                    
+                    # Draw dropdown arrow
+                    arrow_points = [
+                        (value_rect.right - 20, value_rect.centery - 3),
+                        (value_rect.right - 15, value_rect.centery + 3),
+                        (value_rect.right - 10, value_rect.centery - 3)
+                    ]
+                    pg.draw.polygon(surface, (200, 200, 200), arrow_points)
+                    
+                    # Draw current value
+                    text = self.small_font.render(value, True, (255, 140, 0))
+                    surface.blit(text, (value_rect.x + 5, value_rect.y + 2))
+                    
+                    # Add to dropdown list for click handling
+                    dropdownList.append((value_rect, param))
                 else:
-                    if param == 'device' or param == 'method':
-                        value_rect = pg.Rect(panel_rect.x + 200, y_offset, 100, 25)
-                        # Draw main box
-                        pg.draw.rect(self.screen, (40, 40, 40), value_rect)
-                        pg.draw.rect(self.screen, (200, 200, 200), value_rect, 2)
-                        
-                        # Draw dropdown arrow
-                        arrow_points = [
-                            (value_rect.right - 20, value_rect.centery - 3),
-                            (value_rect.right - 15, value_rect.centery + 3),
-                            (value_rect.right - 10, value_rect.centery - 3)
-                        ]
-                        pg.draw.polygon(self.screen, (200, 200, 200), arrow_points)
-                        
-                        # Draw current value
-                        text = self.small_font.render(value, True, (255, 140, 0))
-                        self.screen.blit(text, (value_rect.x + 5, value_rect.y + 2))
-                        
-                        # Add to dropdown list for click handling
-                        dropdownList.append((value_rect, param))
+                    value_rect = pg.Rect(panel_rect.x + 200, y_offset, 60, 25)
+                    pg.draw.rect(surface, (40, 40, 40), value_rect)
+                    pg.draw.rect(surface, (200, 200, 200), value_rect, 2)
+                    
+                    if self.editing_parameter == param:
+                        text = self.small_font.render(self.edit_text + "|", True, (255, 140, 0))
                     else:
-                        value_rect = pg.Rect(panel_rect.x + 200, y_offset, 60, 25)
-                        pg.draw.rect(self.screen, (40, 40, 40), value_rect)
-                        pg.draw.rect(self.screen, (200, 200, 200), value_rect, 2)
-                        
-                        if self.editing_parameter == param:
-                            text = self.small_font.render(self.edit_text + "|", True, (255, 140, 0))
-                        else:
-                            text = self.small_font.render(str(value), True, (255, 140, 0))
-                        self.screen.blit(text, (value_rect.x + 5, value_rect.y + 2))
+                        text = self.small_font.render(str(value), True, (255, 140, 0))
+                    surface.blit(text, (value_rect.x + 5, value_rect.y + 2))
+            
+            y_offset += 40
+
+        hovered = self._panel_key()[-1]
+        for value_rect, param in dropdownList:
+            if self.dropdown_open and self.editing_parameter == param:
+                options = self.dropdown_options[self.editing_parameter]
+                dropdown_height = len(options) * 25
+                dropdown_rect = pg.Rect(value_rect.x, value_rect.bottom, value_rect.width, dropdown_height)
+                pg.draw.rect(surface, (60, 60, 60), dropdown_rect)
+                pg.draw.rect(surface, (200, 200, 200), dropdown_rect, 2)
                 
-                y_offset += 40
-
-            for value_rect, param in dropdownList:
-                if self.dropdown_open and self.editing_parameter == param:
-                    options = ['cuda', 'cpu'] if self.editing_parameter == 'device' else ['Euler', 'Verlet']
-                    dropdown_height = len(options) * 25
-                    dropdown_rect = pg.Rect(value_rect.x, value_rect.bottom, value_rect.width, dropdown_height)
-                    pg.draw.rect(self.screen, (60, 60, 60), dropdown_rect)
-                    pg.draw.rect(self.screen, (200, 200, 200), dropdown_rect, 2)
+                for i, option in enumerate(options):
+                    option_rect = pg.Rect(dropdown_rect.x, dropdown_rect.y + i * 25, dropdown_rect.width, 25)
+                    if i == hovered:
+                        pg.draw.rect(surface, (80, 80, 80), option_rect)
                     
-                    for i, option in enumerate(options):
-                        option_rect = pg.Rect(dropdown_rect.x, dropdown_rect.y + i * 25, dropdown_rect.width, 25)
-                        if option_rect.collidepoint(pg.mouse.get_pos()):
-                            pg.draw.rect(self.screen, (80, 80, 80), option_rect)
-                        
-                        text = self.small_font.render(option, True, (255, 140, 0))
-                        self.screen.blit(text, (option_rect.x + 5, option_rect.y + 2))
+                    text = self.small_font.render(option, True, (255, 140, 0))
+                    surface.blit(text, (option_rect.x + 5, option_rect.y + 2))
 
     def handle_event(self, event):
         if event.type == pg.MOUSEBUTTONDOWN:
@@ -243,26 +403,28 @@ class UI:
                     panel_x = self.screen.get_width() - 300
                     param_index = list(self.parameters.keys()).index(self.editing_parameter)
                     value_rect = pg.Rect(panel_x + 200, 80 + param_index * 40, 100, 25)
-                    dropdown_rect = pg.Rect(value_rect.x, value_rect.bottom, value_rect.width, 50)
+                    options = self.dropdown_options[self.editing_parameter]
+                    dropdown_rect = pg.Rect(value_rect.x, value_rect.bottom, value_rect.width, len(options) * 25)
                     
                     # Check for clicks inside dropdown menu
                     if dropdown_rect.collidepoint(event.pos):
-                        options = ['cuda', 'cpu'] if self.editing_parameter == 'device' else ['Euler', 'Verlet']
                         option_idx = (event.pos[1] - dropdown_rect.y) // 25
                         if 0 <= option_idx < len(options):
                             if self.editing_parameter == 'device':
                                 selected_device = options[option_idx]
                                 if selected_device == 'cuda' and torch.cuda.is_available():
                                     self.parameters['device'] = 'cuda'
+                                elif selected_device == 'auto':
+                                    self.parameters['device'] = 'auto'
                                 else:
                                     self.parameters['device'] = 'cpu'
-                            else:  # method parameter
-                                self.parameters['method'] = options[option_idx]
+                            else:
+                                self.parameters[self.editing_parameter] = options[option_idx]
                             
+                            param = self.editing_parameter
                             self.dropdown_open = False
                             self.editing_parameter = None
-                            if self.cloth is not None:
-                                self.setup_cloth()
+                            self.apply_parameter(param)
                             return
                     
                     # Close dropdown if clicked outside
@@ -284,7 +446,7 @@ class UI:
                                     self.parameters[param] = not value
                                     return
                             else:
-                                if param == 'device' or param == 'method':
+                                if param in self.dropdown_options:
                                     value_rect = pg.Rect(panel_x + 200, y_offset, 100, 25)
                                     if value_rect.collidepoint(event.pos):
                                         self.dropdown_open = not self.dropdown_open
@@ -315,6 +477,12 @@ class UI:
                         elif button['text'] == "Exit":
                             self.quit()
                         return
+
+                self.grab(event.pos)
+
+        elif event.type == pg.MOUSEBUTTONUP:
+            if event.button == 1 and self.dragging:
+                self.release()
             
         elif event.type == pg.KEYDOWN:
             # Only process keyboard input if parameters panel is open
@@ -327,6 +495,7 @@ class UI:
                             self.parameters[self.editing_parameter] = float(self.edit_text)
                     except ValueError:
                         pass  # Invalid input, keep old value
+                    self.apply_parameter(self.editing_parameter)
                     self.editing_parameter = None
                 elif event.key == pg.K_ESCAPE:
                     self.editing_parameter = None
@@ -340,6 +509,8 @@ class UI:
                 self.quit()
         
         elif event.type == pg.MOUSEMOTION:
+            if self.dragging:
+                self.drag(event.pos)
             # Update button hover states
             mouse_pos = event.pos
             for button in self.buttons:
@@ -350,12 +521,85 @@ class UI:
                     if panel_rect.collidepoint(button['rect'][0], button['rect'][1]):
                         button['hover'] = False
 
+    def display_area(self):
+        """Screen rectangle the cloth is drawn into"""
+        return pg.Rect(0, self.toolbar_height,
+                       self.screen.get_width() - (300 if self.show_parameters else 0),
+                       self.screen.get_height() - self.toolbar_height)
+
+    def _cursor(self, pos):
+        """Cloth coordinates (y, x) under screen position pos, and the view transform"""
+        area = self.display_area()
+        scale, offset = self.cloth.view_transform(area.width, area.height)
+        pixel = torch.tensor([pos[1] - area.y + 0.5, pos[0] - area.x + 0.5])
+        return (pixel - offset) / scale, scale, offset
+
+    def edit_cloth(self, edit):
+        """Run edit(cloth) now, or on the worker between its ticks while it owns the cloth"""
+        if self.worker is not None:
+            self.worker.submit(edit)
+        else:
+            edit(self.cloth)
+
+    def grab(self, pos):
+        """Pin the free particles near a click in the display area to the mouse"""
+        if self.cloth is None or not hasattr(self.cloth, 'pin') or not self.display_area().collidepoint(pos):
+            return
+        self.dragging = True
+        cursor, scale, offset = self._cursor(pos)
+
+        def edit(cloth):
+            cloth_pos = cloth.pos if cloth.batch is None else cloth.pos[cloth.render_index]
+            cloth_pos = cloth_pos.cpu()
+            # Distance in pixels, since the view scales the two axes differently
+            distance = torch.linalg.vector_norm((cloth_pos - cursor) * scale, dim=-1)
+            mask = (distance <= self.grab_radius) & ~cloth.pinned[..., 0].cpu()
+            if not mask.any():
+                return
+            self.grabbed = (cloth, mask.to(cloth.pos.device), (cloth_pos[mask] - cursor).to(cloth.pos.device))
+            cloth.pin(self.grabbed[1])
+
+        self.edit_cloth(edit)
+
+    def drag(self, pos):
+        """Move the grabbed particles' pin targets along with the mouse"""
+        cursor = self._cursor(pos)[0]
+
+        def edit(cloth):
+            if self.grabbed is None:
+                return
+            grabbed, mask, offsets = self.grabbed
+            if grabbed is not cloth or mask.shape != cloth.pinned.shape[:2]:
+                self.grabbed = None
+                return
+            cloth.move_pins(mask, offsets + cursor.to(offsets.device))
+
+        self.edit_cloth(edit)
+
+    def release(self):
+        """Let go of the grabbed particles"""
+        self.dragging = False
+
+        def edit(cloth):
+            if self.grabbed is None:
+                return
+            grabbed, mask, _ = self.grabbed
+            self.grabbed = None
+            if grabbed is cloth and mask.shape == cloth.pinned.shape[:2]:
+                cloth.unpin(mask)
+
+        self.edit_cloth(edit)
+
     def clear(self):
         self.buttons.clear()
         self.selected_button = None
 
     def setup_cloth(self):
         """Initialize cloth with current parameters"""
+        self.stop_worker()
+        if self.replay is not None:
+            self.cloth = TrajectoryReplay(self.replay)
+            return
         self.cloth = Cloth(
             height=int(self.parameters['height']),
             width=int(self.parameters['width']),
@@ -367,26 +611,93 @@ class UI:
             decay=self.parameters['decay'],
             init_energy=self.parameters['init_energy'],
             device=self.parameters['device'],
-            method=self.parameters['method'].lower()  # Add method parameter
+            method=self.parameters['method'].lower(),  # Add method parameter
+            iterations=int(self.parameters['iterations']),
+            backend=self.parameters['backend'].lower(),
         )
+        # implicit and pbd never settle, so they always start from the flat grid
+        if self.parameters['settled'] and self.cloth.method in SETTLE_METHODS:
+            self.settled_cache.load(self.cloth)
+        self.profiler.reset()
+
+    def apply_parameter(self, param):
+        """Push an edited parameter into the running cloth without rebuilding it"""
+        if self.cloth is None or param not in self.live_parameters or not hasattr(self.cloth, 'set_params'):
+            return
+        # The worker owns the cloth while it runs; update() starts a new one
+        self.stop_worker()
+        value = self.parameters[param]
+        self.cloth.set_params(**{param: value.lower() if param in ('method', 'backend') else value})
 
     def update(self):
         """Update the simulation"""
-        if self.running and self.cloth is not None:
-            # Get the rendered frame from cloth
-            frame = self.cloth.forward()[::-1, ]
-            
-            # Convert numpy array to pygame surface efficiently
-            frame = np.transpose(frame, (1, 0, 2))  # Swap axes for pygame
-            surface = pg.surfarray.make_surface(frame)
-            
-            # Scale the surface to fit the display area
-            display_area = pg.Rect(0, self.toolbar_height, 
-                                 self.screen.get_width() - (300 if self.show_parameters else 0),
-                                 self.screen.get_height() - self.toolbar_height)
-            
-            scaled_surface = pg.transform.scale(surface, display_area.size)
-            self.screen.blit(scaled_surface, display_area)
+        if self.cloth is None:
+            return
+        if hasattr(self.cloth, 'profiler'):
+            self.cloth.profiler = self.profiler if self.parameters['profile'] else None
+        display_area = self.display_area()
+        size = (display_area.width + 2, display_area.height + 2)
+        if self.frame_surface is None or self.frame_surface.get_size() != size:
+            self.frame_surface = pg.Surface(size, 0, self.screen)
+            self.frame_color = int(np.array(self.frame_surface.map_rgb((0, 255, 0)), dtype=np.uint32).view(np.int32))
+        render = self.parameters['render']
+        mode = 'points' if render == 'Points' else 'mesh'
+        color_by = {'Strain': 'strain', 'Velocity': 'velocity'}.get(render)
+        shifts = self.frame_surface.get_shifts()[:3]
+        substeps = max(1, int(self.parameters['substeps']))
+        fresh = False
+
+        if self.parameters['threaded']:
+            # The worker steps and rasterizes; here we only pick up its newest frame
+            if self.worker is None:
+                self.worker = SimulationThread(self.cloth)
+                self.worker.start()
+            self.worker.substeps = substeps
+            self.worker.frame_size = size
+            self.worker.color = self.frame_color
+            self.worker.mode, self.worker.color_by, self.worker.shifts = mode, color_by, shifts
+            if self.running:
+                self.worker.running.set()
+            else:
+                self.worker.running.clear()
+            frame = self.worker.frames.latest()
+            if frame is not None and tuple(frame.shape) == size:
+                with self.phase("surface"):
+                    pixels = pg.surfarray.pixels2d(self.frame_surface)
+                    torch.from_numpy(pixels.view(np.int32)).copy_(frame)
+                    del pixels
+                fresh = True
+        else:
+            self.stop_worker()
+            if not self.running:
+                return
+            with self.phase("tick"):
+                self.cloth.tick(substeps=substeps)
+
+            # pixels2d is a view of the surface memory; drop it before blitting to unlock
+            with self.phase("render"):
+                pixels = pg.surfarray.pixels2d(self.frame_surface)
+                self.cloth.render_into(torch.from_numpy(pixels.view(np.int32)), self.frame_color,
+                                       mode=mode, color_by=color_by, shifts=shifts)
+                del pixels
+            fresh = True
+
+        # Only a new frame touches the screen; the last one stays up while paused
+        if fresh:
+            with self.phase("blit"):
+                self.screen.blit(self.frame_surface, display_area, pg.Rect(1, 1, *display_area.size))
+                # The toolbar's bottom line overlaps the top of the display area
+                if self.toolbar_cache is not None:
+                    line = pg.Rect(0, self.toolbar_height, display_area.width, 2)
+                    self.screen.blit(self.toolbar_cache, line, line)
+            self.frame_area = display_area
+            self.dirty.append(display_area)
+
+    def stop_worker(self):
+        """Stop the background simulation worker, if any"""
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
 
     def reset(self):
         # Reset the UI state if needed
@@ -395,6 +706,7 @@ class UI:
 
     def quit(self):
         # Clean up resources if needed
+        self.stop_worker()
         pg.quit()
 
     def toggle_parameters(self):